@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+
+"""
+Check that the bidirectional search finds paths as cheap as the one-sided
+search on seeded maps, in every traversal mode, and compare their speed.
+
+Needs the package installed (pip install -e .), run from the repository root:
+python scripts/bidirectional_check.py
+"""
+
+import random
+import sys
+import time
+
+from vindonissa.game_setup import mapgen
+from vindonissa.static_data.movement_costs import traderoute_cost
+
+SEEDS = [1, 42, 1337]
+QUERIES = 200
+MODES = [{}, {"only_land": True}, {"only_water": True}]
+
+
+def check(map, pairs, mode) -> tuple[int, float, float]:
+    """
+    Returns the number of pairs with differing path costs and the time of both searches.
+    """
+    start_time = time.process_time()
+    paths = [map.cell_to_cell_path(source, target, traderoute_cost, cached=False, **mode) for source, target in pairs]
+    one_sided_time = time.process_time() - start_time
+
+    start_time = time.process_time()
+    bidirectional_paths = [map.cell_to_cell_path(source, target, traderoute_cost, bidirectional=True, cached=False, **mode) for source, target in pairs]
+    bidirectional_time = time.process_time() - start_time
+
+    mismatches = 0
+    for (source, target), path, bidirectional_path in zip(pairs, paths, bidirectional_paths):
+        if not path and not bidirectional_path:
+            continue
+        if not path or not bidirectional_path or bidirectional_path[0] != source or bidirectional_path[-1] != target:
+            mismatches += 1
+        elif map.path_cost(path, traderoute_cost) != map.path_cost(bidirectional_path, traderoute_cost):
+            mismatches += 1
+    return mismatches, one_sided_time, bidirectional_time
+
+
+if __name__ == "__main__":
+    failed = False
+    for seed in SEEDS:
+        random.seed(seed)
+        map = mapgen.create_worldmap()
+        pairs = [random.sample(map.cells, 2) for _ in range(QUERIES)]
+        for mode in MODES:
+            mismatches, one_sided_time, bidirectional_time = check(map, pairs, mode)
+            name = ", ".join(mode) or "any"
+            print(f"seed {seed:>5} {name:>10}: {mismatches} mismatches, one-sided {one_sided_time:.2f}s, bidirectional {bidirectional_time:.2f}s")
+            failed = failed or mismatches > 0
+    sys.exit(1 if failed else 0)
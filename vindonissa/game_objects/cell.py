@@ -7,6 +7,7 @@ from typing import TYPE_CHECKING
 
 if TYPE_CHECKING:
     from vindonissa.game_objects.waterbody import Ocean, Lake
+    from vindonissa.game_objects.landmass import Continent, Island
     from vindonissa.game_objects.river import River
     from vindonissa.game_objects.city import City
 
@@ -19,7 +20,6 @@ class Cell (object):
         self.elevation = elevation
         self.coords = coords
         self.elevation_category = elevation_category
-        self.vertices = set()
 
         # map stuff
         self.trees: float = treelevel
@@ -31,6 +31,7 @@ class Cell (object):
         self.is_deep_water = True if is_water else False  # does not border a land cell
         self.is_coastal = False  # borders water as land cell
         self.water_body: Ocean|Lake|None = None
+        self.landmass: Continent|Island|None = None
 
         # city info
         self.city_center: City|None = None
@@ -55,9 +56,9 @@ class Cell (object):
 
         # util attributes
         self.distance = 0
+        self.search_epoch = 0  # id of the last search that reached this node
         self.search_heuristic = 0
         self.path_from: Cell|None = None
-        self.next_cell_with_same_prio: Cell|None = None
 
     @property
     def search_priority(self) -> int:
@@ -30,9 +30,9 @@ class WayNode(object):
 
         # util attributes
         self.distance = 0
+        self.search_epoch = 0  # id of the last search that reached this node
         self.search_heuristic = 0
         self.path_from: WayNode|None = None
-        self.next_cell_with_same_prio: WayNode|None = None
 
     @property
     def search_priority(self) -> int:
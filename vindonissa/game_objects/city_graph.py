@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+
+import hashlib
+from heapq import heappush, heappop
+import math
+from multiprocessing import Pool
+import os
+from typing import Dict, List
+
+import numpy as np
+
+from vindonissa.game_objects.city import WayNode, City, Port
+from vindonissa.util.landmarks import Landmarks, select_landmarks, NUM_LANDMARKS
+from vindonissa.util.contraction_hierarchy import ContractionHierarchy
+
+
+PORT_TO_CITY_COST = 40  # TODO: get distance to city also as an information to the port
+PATHS_PER_TASK = 2  # pairs a pool worker searches per task of wealth_modified_paths, the factors are sent once per task
+
+
+class CityGraph(object):
+    """
+    Compact snapshot of the city/port network built by citygen.connect_cities.
+    Cities are the nodes 0..len(cities)-1 (same as their id), ports follow.
+    Edges are stored in CSR form with the same costs city_to_city_path uses.
+    """
+    def __init__(self, cities: List[City]):
+        self.nodes: List[WayNode] = list(cities) + [p for c in cities for p in c.ports]
+        self.num_cities = len(cities)
+        self.index: Dict[WayNode, int] = {node: i for i, node in enumerate(self.nodes)}
+
+        offsets = [0]
+        indices = []
+        weights = []
+        for node in self.nodes:
+            if type(node) == City:
+                neighbors = node.neighbors + node.ports
+                costs = list(node.land_connections.values()) + node.port_connections
+            elif type(node) == Port:
+                neighbors = [p for p, v in node.port_connections] + [node.city]
+                costs = [v for p, v in node.port_connections] + [PORT_TO_CITY_COST]
+            else:
+                raise ValueError
+            assert len(neighbors) == len(costs)
+            indices.extend([self.index[n] for n in neighbors])
+            weights.extend(costs)
+            offsets.append(len(indices))
+
+        self.offsets: List[int] = offsets
+        self.indices: List[int] = indices
+        self.weights: List[int] = weights
+        self.is_port: List[bool] = [type(node) == Port for node in self.nodes]
+        # city id of every node, ports belong to their city
+        self.node_city: List[int] = [node.id if type(node) == City else node.city.id for node in self.nodes]  # type: ignore
+
+        # the same edges pointing the other way, for distances towards a node
+        reverse_edges: List[List[tuple[int, int]]] = [[] for _ in self.nodes]
+        for source in range(len(self.nodes)):
+            for k in range(offsets[source], offsets[source + 1]):
+                reverse_edges[indices[k]].append((source, weights[k]))
+        self.reverse_offsets: List[int] = [0]
+        for edges in reverse_edges:
+            self.reverse_offsets.append(self.reverse_offsets[-1] + len(edges))
+        self.reverse_indices: List[int] = [source for edges in reverse_edges for source, w in edges]
+        self.reverse_weights: List[int] = [w for edges in reverse_edges for source, w in edges]
+
+        # per traversal mode, the strongly connected component of every node (-1 for nodes that can't be entered)
+        # and the components reachable from each component as bits
+        self.components: Dict[str, tuple[List[int], List[int]]] = {}
+        for mode, mask in (("any", [True] * len(self.nodes)), ("land", [not p for p in self.is_port]), ("water", self.is_port)):
+            self.components[mode] = reachable_components(offsets, indices, mask)
+        # how many searches were answered without searching, per traversal mode
+        self.rejected_searches: Dict[str, int] = {"any": 0, "land": 0, "water": 0}
+
+        # ALT landmarks for the A* heuristic of city_to_city_path
+        self.landmarks: Landmarks = Landmarks([], [], [])
+        # built on the first query
+        self.hierarchy: ContractionHierarchy|None = None
+
+    @property
+    def arrays(self) -> tuple[List[int], List[int], List[int], List[bool]]:
+        """
+        Everything a search needs, without references to the game objects.
+        """
+        return self.offsets, self.indices, self.weights, self.is_port
+
+    @property
+    def reverse_arrays(self) -> tuple[List[int], List[int], List[int], List[bool]]:
+        return self.reverse_offsets, self.reverse_indices, self.reverse_weights, self.is_port
+
+    def is_reachable(self, source: int, target: int, only_land=False, only_water=False) -> bool:
+        """
+        Whether a search with these restrictions can find a path at all.
+        Like the searches, only the nodes after the source have to fit the restriction.
+        """
+        if source == target:
+            return True
+        labels, reach = self.components["land" if only_land else "water" if only_water else "any"]
+        if labels[target] == -1:
+            return False
+        if labels[source] != -1:
+            return reach[labels[source]] >> labels[target] & 1 == 1
+        return any([labels[n] != -1 and reach[labels[n]] >> labels[target] & 1 == 1 for n in self.indices[self.offsets[source]:self.offsets[source + 1]]])
+
+    def add_landmarks(self, count: int = NUM_LANDMARKS):
+        self.landmarks = select_landmarks(
+            list(range(len(self.nodes))),
+            lambda node: shortest_distances(self.arrays, node),
+            lambda node: shortest_distances(self.reverse_arrays, node),
+            count=count)
+
+    def shortest_path(self, source: WayNode, target: WayNode) -> tuple[float, List[WayNode]]:
+        """
+        Distance and path between two nodes, answered by the contraction hierarchy.
+        """
+        if self.hierarchy is None:
+            self.hierarchy = ContractionHierarchy(self.offsets, self.indices, self.weights)
+        distance, path = self.hierarchy.query(self.index[source], self.index[target])
+        return distance, [self.nodes[idx] for idx in path]
+
+    def path_pool(self, processes: int) -> Pool:  # type: ignore
+        """
+        Process pool for wealth_modified_paths, the workers get the network once.
+        It can be used for any number of calls while the graph stays the same, the caller closes it.
+        """
+        return Pool(processes, initializer=_init_path_worker, initargs=(self.offsets, self.indices, self.weights, self.node_city, self.landmarks))
+
+    def wealth_modified_paths(self, pairs: List[tuple[WayNode, WayNode]], factors: List[float], heuristic_factor: float, pool=None) -> List[List[WayNode]]:
+        """
+        Shortest paths between the pairs after dividing the cost of moving to each city (or one of its ports)
+        by the factor of the city the way the wealth modifier does. The modified costs are at least
+        heuristic_factor times the plain ones, which keeps the landmark heuristic admissible.
+        factors: Per city id.
+        pool: From path_pool, to search the pairs in parallel, the paths come back in order of the pairs.
+        The workers only get the factors and derive the modified costs themselves.
+        """
+        paths: List[List[int]] = [[] for _ in pairs]
+        searched = []
+        jobs = []
+        for k, (source, target) in enumerate(pairs):
+            if not self.is_reachable(self.index[source], self.index[target]):
+                self.rejected_searches["any"] += 1
+                continue
+            searched.append(k)
+            jobs.append((self.index[source], self.index[target]))
+        if pool is not None:
+            tasks = [(factors, heuristic_factor, jobs[k:k + PATHS_PER_TASK]) for k in range(0, len(jobs), PATHS_PER_TASK)]
+            results = [path for task_paths in pool.starmap(_worker_find_paths, tasks) for path in task_paths]
+        else:
+            weights = wealth_modified_weights(self.weights, self.indices, self.node_city, factors)
+            results = [find_path(self.offsets, self.indices, weights, self.landmarks, heuristic_factor, source, target) for source, target in jobs]
+        for k, path in zip(searched, results):
+            paths[k] = path
+        return [[self.nodes[idx] for idx in path] for path in paths]
+
+    def fingerprint(self) -> str:
+        """
+        Changes whenever the network or its costs change, used to validate cached results.
+        """
+        h = hashlib.sha1()
+        for a in self.arrays:
+            h.update(np.asarray(a, dtype=np.int64).tobytes())
+        return h.hexdigest()
+
+    def shortest_distances(self, source: WayNode, only_land=False, only_water=False) -> List[float]:
+        """
+        Distance from source to every node, math.inf if unreachable.
+        """
+        return shortest_distances(self.arrays, self.index[source], only_land, only_water)
+
+    def city_distance_matrix(self, processes: int|None = None) -> np.ndarray:
+        """
+        Distances between all pairs of cities, ports can be used on the way.
+        One dijkstra per city, spread over a process pool if processes is given.
+        """
+        sources = list(range(self.num_cities))
+        if processes is not None and processes > 1:
+            with Pool(processes, initializer=_init_worker, initargs=(self.arrays, self.num_cities)) as pool:
+                rows = pool.map(_worker_city_distances, sources, chunksize=max(1, len(sources) // (processes * 4)))
+        else:
+            rows = [shortest_distances(self.arrays, s)[:self.num_cities] for s in sources]
+        return np.array(rows, dtype=np.float32).reshape(self.num_cities, self.num_cities)
+
+    def load_or_compute_city_distances(self, cache_path: str, processes: int|None = None) -> np.ndarray:
+        """
+        Read the distance matrix from an .npz file if it belongs to this network,
+        otherwise compute it and write it there.
+        """
+        fingerprint = self.fingerprint()
+        if os.path.exists(cache_path):
+            with np.load(cache_path) as cached:
+                if str(cached["fingerprint"]) == fingerprint:
+                    return cached["distances"]
+        distances = self.city_distance_matrix(processes=processes)
+        os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+        np.savez_compressed(cache_path, fingerprint=fingerprint, distances=distances)
+        return distances
+
+
+def reachable_components(offsets: List[int], indices: List[int], mask: List[bool]) -> tuple[List[int], List[int]]:
+    """
+    Strongly connected components of the nodes with mask set, only following edges between such nodes,
+    found by an iterative Tarjan. Returns the component of every node (-1 outside the mask)
+    and for every component the components reachable from it (itself included) as bits.
+    """
+    index = [-1] * (len(offsets) - 1)
+    low = [0] * (len(offsets) - 1)
+    on_stack = [False] * (len(offsets) - 1)
+    labels = [-1] * (len(offsets) - 1)
+    reach: List[int] = []
+    stack: List[int] = []
+    counter = 0
+    for root in range(len(offsets) - 1):
+        if not mask[root] or index[root] != -1:
+            continue
+        index[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack[root] = True
+        work = [(root, offsets[root])]
+        while work:
+            node, k = work[-1]
+            while k < offsets[node + 1]:
+                neighbor = indices[k]
+                k += 1
+                if not mask[neighbor]:
+                    continue
+                if index[neighbor] == -1:
+                    # descend, continue with the next edge of node afterwards
+                    work[-1] = (node, k)
+                    index[neighbor] = low[neighbor] = counter
+                    counter += 1
+                    stack.append(neighbor)
+                    on_stack[neighbor] = True
+                    work.append((neighbor, offsets[neighbor]))
+                    break
+                elif on_stack[neighbor]:
+                    low[node] = min(low[node], index[neighbor])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[node])
+                if low[node] == index[node]:
+                    # components are completed sinks first, so everything they reach is labelled already
+                    component = len(reach)
+                    members = []
+                    while True:
+                        member = stack.pop()
+                        on_stack[member] = False
+                        labels[member] = component
+                        members.append(member)
+                        if member == node:
+                            break
+                    bits = 1 << component
+                    for member in members:
+                        for j in range(offsets[member], offsets[member + 1]):
+                            neighbor = indices[j]
+                            if mask[neighbor] and labels[neighbor] != component:
+                                bits |= reach[labels[neighbor]]
+                    reach.append(bits)
+    return labels, reach
+
+
+def shortest_distances(arrays, source: int, only_land=False, only_water=False) -> List[float]:
+    """
+    Dijkstra over the CSR arrays of a CityGraph.
+    """
+    offsets, indices, weights, is_port = arrays
+    distance: List[float] = [math.inf] * (len(offsets) - 1)
+    distance[source] = 0
+    frontier = [(0, source)]
+    while frontier:
+        current_distance, current = heappop(frontier)
+        if current_distance > distance[current]:
+            continue  # outdated entry, node was reached cheaper since
+        for k in range(offsets[current], offsets[current + 1]):
+            neighbor = indices[k]
+            if only_land and is_port[neighbor]:
+                continue
+            elif only_water and not is_port[neighbor]:
+                continue
+            new_distance = current_distance + weights[k]
+            if new_distance < distance[neighbor]:
+                distance[neighbor] = new_distance
+                heappush(frontier, (new_distance, neighbor))
+    return distance
+
+
+def wealth_modified_weights(weights: List[int], indices: List[int], node_city: List[int], factors: List[float]) -> List[int]:
+    """
+    Edge costs with the wealth modifier of the city each edge leads to.
+    """
+    return [round(w * 0.5 + ((w / factors[node_city[v]]) * 0.5)) for w, v in zip(weights, indices)]
+
+
+def find_path(offsets: List[int], indices: List[int], weights: List[int], landmarks: Landmarks, heuristic_factor: float, source: int, target: int) -> List[int]:
+    """
+    A* over the CSR arrays of a CityGraph, guided by its landmarks scaled by heuristic_factor.
+    Returns the nodes on the path, empty if there is none.
+    """
+    bounds = landmarks.towards(target)
+
+    distance: Dict[int, float] = {source: 0}
+    path_from: Dict[int, int] = {source: -1}
+    heuristics: Dict[int, float] = {source: 0}
+    frontier = [(0, source)]
+    while frontier:
+        priority, current = heappop(frontier)
+        current_distance = distance[current]
+        if priority > current_distance + heuristics[current]:
+            continue  # outdated entry, node was reached cheaper since
+
+        if current == target:
+            path = []
+            while current != -1:
+                path.append(current)
+                current = path_from[current]
+            return list(reversed(path))
+
+        for k in range(offsets[current], offsets[current + 1]):
+            neighbor = indices[k]
+            new_distance = current_distance + weights[k]
+            if new_distance < distance.get(neighbor, math.inf):
+                if neighbor not in heuristics:
+                    h = 0
+                    for f, b, ft, bt in bounds:
+                        h = max(h, ft - f[neighbor], b[neighbor] - bt)
+                    heuristics[neighbor] = math.floor(h * heuristic_factor) if h != math.inf else h
+                if heuristics[neighbor] == math.inf:
+                    continue  # dead end, the target can't be reached from there
+                distance[neighbor] = new_distance
+                path_from[neighbor] = current
+                heappush(frontier, (new_distance + heuristics[neighbor], neighbor))
+    return []
+
+
+# state of the pool workers, set once per process
+_worker_arrays = None
+_worker_num_cities = 0
+_worker_offsets: List[int] = []
+_worker_indices: List[int] = []
+_worker_weights: List[int] = []
+_worker_node_city: List[int] = []
+_worker_landmarks: Landmarks = Landmarks([], [], [])
+
+
+def _init_worker(arrays, num_cities: int):
+    global _worker_arrays, _worker_num_cities
+    _worker_arrays = arrays
+    _worker_num_cities = num_cities
+
+
+def _worker_city_distances(source: int) -> List[float]:
+    return shortest_distances(_worker_arrays, source)[:_worker_num_cities]
+
+
+def _init_path_worker(offsets: List[int], indices: List[int], weights: List[int], node_city: List[int], landmarks: Landmarks):
+    global _worker_offsets, _worker_indices, _worker_weights, _worker_node_city, _worker_landmarks
+    _worker_offsets = offsets
+    _worker_indices = indices
+    _worker_weights = weights
+    _worker_node_city = node_city
+    _worker_landmarks = landmarks
+
+
+def _worker_find_paths(factors: List[float], heuristic_factor: float, pairs: List[tuple[int, int]]) -> List[List[int]]:
+    weights = wealth_modified_weights(_worker_weights, _worker_indices, _worker_node_city, factors)
+    return [find_path(_worker_offsets, _worker_indices, weights, _worker_landmarks, heuristic_factor, source, target) for source, target in pairs]
@@ -0,0 +1,554 @@
+#!/usr/bin/env python3
+
+from heapq import heappush, heappop
+import math
+from typing import Callable, Dict, List
+
+import numpy as np
+
+from vindonissa.util.priority_queues import QUEUE_TYPES
+from vindonissa.util.union_find import label_components
+from vindonissa.util.landmarks import Landmarks, select_landmarks, NUM_LANDMARKS
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from vindonissa.game_objects.cell import Cell
+
+
+ACTIVE_LANDMARKS = 3  # landmarks per side in bidirectional searches, fewer bounds per node are cheaper than slightly tighter ones
+
+
+class WorldGraph(object):
+    """
+    Compact array representation of the cell graph for pathfinding.
+    Nodes are cell ids, edges are stored in CSR form: the neighbors of cell i
+    are indices[offsets[i]:offsets[i+1]]. Edge weights are precomputed per
+    cost function and aligned with indices.
+    """
+    def __init__(self, cells: List["Cell"], offsets: np.ndarray, indices: np.ndarray):
+        self.size = len(offsets) - 1
+        self.offsets: np.ndarray = offsets
+        self.indices: np.ndarray = indices
+
+        self.exists: np.ndarray = np.zeros(self.size, dtype=bool)
+        self.is_water: np.ndarray = np.zeros(self.size, dtype=bool)
+        self.x: np.ndarray = np.zeros(self.size, dtype=np.float64)
+        self.y: np.ndarray = np.zeros(self.size, dtype=np.float64)
+        for cell in cells:
+            self.exists[cell.id] = True
+            self.is_water[cell.id] = cell.is_water
+            self.x[cell.id] = cell.x
+            self.y[cell.id] = cell.y
+        self.is_land: np.ndarray = self.exists & ~self.is_water
+
+        # edge weights per cost function
+        self.edge_costs: Dict[Callable, np.ndarray] = {}
+
+        # plain lists, as per-element access on them is much faster than on numpy arrays
+        self._offsets: List[int] = offsets.tolist()
+        self._indices: List[int] = indices.tolist()
+        self._is_water: List[bool] = self.is_water.tolist()
+        self._x: List[float] = self.x.tolist()
+        self._y: List[float] = self.y.tolist()
+        self._edge_costs: Dict[Callable, List[int]] = {}
+        # ALT landmarks per cost function, for tighter A* heuristics
+        self.landmarks: Dict[Callable, Landmarks] = {}
+
+        # position of the opposite edge (target -> source) for every edge
+        sources = np.repeat(np.arange(self.size), np.diff(offsets))
+        keys = sources.astype(np.int64) * self.size + indices
+        order = np.argsort(keys)
+        reverse_keys = indices.astype(np.int64) * self.size + sources
+        self.reverse_edges: np.ndarray = order[np.searchsorted(keys, reverse_keys, sorter=order)]
+        self._reverse_edges: List[int] = self.reverse_edges.tolist()
+
+        # component label per cell id for each traversal mode, -1 for cells that can't be entered
+        self.components: Dict[str, np.ndarray] = {}
+        self._components: Dict[str, List[int]] = {}
+        self.setup_components()
+        # how many searches were answered without searching, per traversal mode
+        self.rejected_searches: Dict[str, int] = {"any": 0, "land": 0, "water": 0}
+
+        # search state, kept between searches and stamped with the search epoch
+        # so a search only touches the nodes it reaches
+        self._distance: List[float] = [math.inf] * self.size
+        self._path_from: List[int] = [-1] * self.size
+        self._priority: List[int] = [0] * self.size
+        self._stamp: List[int] = [0] * self.size
+        self._epoch = 0
+        # the bidirectional search also keeps the heuristic and the backward side, same epochs
+        self._heuristic: List[float] = [0] * self.size
+        self._backward_distance: List[float] = [math.inf] * self.size
+        self._backward_path_from: List[int] = [-1] * self.size
+        self._backward_heuristic: List[float] = [0] * self.size
+        self._backward_stamp: List[int] = [0] * self.size
+        self._queues = {}  # one reusable queue per queue type
+
+    def setup_components(self):
+        """
+        Label which cells can reach each other when only moving over land, only over water or over anything.
+        """
+        for mode, mask in (("any", self.exists), ("land", self.is_land), ("water", self.exists & self.is_water)):
+            self.components[mode] = label_components(self.offsets, self.indices, mask)
+            self._components[mode] = self.components[mode].tolist()
+
+    def is_reachable(self, source: int, target: int, only_land=False, only_water=False) -> bool:
+        """
+        Whether a search with these restrictions can find a path at all.
+        Like the searches, only the cells after the source have to fit the restriction.
+        """
+        if source == target:
+            return True
+        labels = self._components["land" if only_land else "water" if only_water else "any"]
+        if labels[target] == -1:
+            return False
+        if labels[source] != -1:
+            return labels[source] == labels[target]
+        return any([labels[n] == labels[target] for n in self._indices[self._offsets[source]:self._offsets[source + 1]]])
+
+    def add_edge_costs(self, cost, cells_by_id: Dict[int, "Cell"]):
+        """
+        Evaluate the cost function once for every directed edge and store the table.
+        """
+        weights = []
+        for idx in range(self.size):
+            if not self.exists[idx]:
+                continue
+            cell = cells_by_id[idx]
+            for neighbor in self._indices[self._offsets[idx]:self._offsets[idx + 1]]:
+                weights.append(cost(cell, cells_by_id[neighbor]))
+        self.edge_costs[cost] = np.array(weights, dtype=np.int32)
+        self._edge_costs[cost] = weights
+
+    def has_edge_costs(self, cost) -> bool:
+        return cost in self._edge_costs
+
+    def clear_edge_costs(self):
+        self.edge_costs.clear()
+        self._edge_costs.clear()
+        self.landmarks.clear()
+
+    def add_landmarks(self, cost, count: int = NUM_LANDMARKS):
+        """
+        Select landmarks and store the distances from and to them with the weights of the cost function.
+        """
+        candidates = [idx for idx in range(self.size) if self.exists[idx]]
+        self.landmarks[cost] = select_landmarks(
+            candidates,
+            lambda node: self.shortest_distances(node, cost),
+            lambda node: self.shortest_distances(node, cost, reverse=True),
+            count=count)
+
+    def shortest_distances(self, source: int, cost, reverse=False) -> List[float]:
+        """
+        Dijkstra from source to every node, math.inf if unreachable.
+        reverse: Distances from every node to source instead.
+        """
+        offsets = self._offsets
+        indices = self._indices
+        weights = self._edge_costs[cost]
+        reverse_edges = self._reverse_edges
+
+        distance: List[float] = [math.inf] * self.size
+        distance[source] = 0
+        frontier = [(0, source)]
+        while frontier:
+            current_distance, current = heappop(frontier)
+            if current_distance > distance[current]:
+                continue  # outdated entry, node was reached cheaper since
+            for k in range(offsets[current], offsets[current + 1]):
+                neighbor = indices[k]
+                new_distance = current_distance + weights[reverse_edges[k] if reverse else k]
+                if new_distance < distance[neighbor]:
+                    distance[neighbor] = new_distance
+                    heappush(frontier, (new_distance, neighbor))
+        return distance
+
+    def edge_index(self, source: int, target: int) -> int:
+        """
+        Position of the edge source -> target in indices and the weight tables.
+        """
+        for k in range(self._offsets[source], self._offsets[source + 1]):
+            if self._indices[k] == target:
+                return k
+        raise KeyError((source, target))
+
+    def edge_cost(self, cost, source: int, target: int) -> int:
+        return self._edge_costs[cost][self.edge_index(source, target)]
+
+    def update_cells(self, cells: List["Cell"], cells_by_id: Dict[int, "Cell"]):
+        """
+        Refresh masks and every stored edge cost that touches one of the cells,
+        e.g. after their terrain, forests or rivers changed.
+        """
+        water_changed = False
+        for cell in cells:
+            water_changed = water_changed or self._is_water[cell.id] != cell.is_water
+            self.is_water[cell.id] = cell.is_water
+            self.is_land[cell.id] = not cell.is_water
+            self._is_water[cell.id] = cell.is_water
+        if water_changed:
+            self.setup_components()
+
+        for cost, weights in self._edge_costs.items():
+            for cell in cells:
+                for k in range(self._offsets[cell.id], self._offsets[cell.id + 1]):
+                    neighbor = cells_by_id[self._indices[k]]
+                    weights[k] = cost(cell, neighbor)
+                    weights[self.edge_index(neighbor.id, cell.id)] = cost(neighbor, cell)
+            self.edge_costs[cost] = np.array(weights, dtype=np.int32)
+
+        # landmark distances can get too long for the new costs, which would overestimate
+        for cost in list(self.landmarks):
+            self.add_landmarks(cost, count=len(self.landmarks[cost].nodes))
+
+    def find_path(self, source: int, target: int, cost, only_land=False, only_water=False, queue: str = "heap") -> List[int]:
+        """
+        A* search over the cell ids with the precomputed weights of the cost function,
+        guided by the landmarks of the cost function if there are any.
+        Returns the ids on the path from source to target, or an empty list if there is none.
+        queue: Type of priority queue, see util.priority_queues.QUEUE_TYPES.
+        """
+        if not self.is_reachable(source, target, only_land=only_land, only_water=only_water):
+            self.rejected_searches["land" if only_land else "water" if only_water else "any"] += 1
+            return []
+
+        offsets = self._offsets
+        indices = self._indices
+        weights = self._edge_costs[cost]
+        is_water = self._is_water
+        xs = self._x
+        ys = self._y
+        tx = xs[target]
+        ty = ys[target]
+        bounds = self.landmarks[cost].towards(target) if cost in self.landmarks else []
+
+        if queue not in self._queues:
+            self._queues[queue] = QUEUE_TYPES[queue]()
+        frontier = self._queues[queue]
+        frontier.clear()
+
+        self._epoch += 1
+        epoch = self._epoch
+        distance = self._distance
+        path_from = self._path_from
+        priority = self._priority
+        stamp = self._stamp
+        stamp[source] = epoch
+        distance[source] = 0
+        priority[source] = 0
+        frontier.push(0, source)
+
+        while len(frontier) > 0:
+            current_priority, current = frontier.pop()
+            if current_priority != priority[current]:
+                continue  # outdated entry, node was reached cheaper since
+
+            # end condition
+            if current == target:
+                path = [current]
+                while current != source:
+                    current = path_from[current]
+                    path.append(current)
+                return list(reversed(path))
+
+            current_distance = distance[current]
+            for k in range(offsets[current], offsets[current + 1]):
+                neighbor = indices[k]
+                if only_land and is_water[neighbor]:
+                    continue
+                elif only_water and not is_water[neighbor]:
+                    continue
+                new_distance = current_distance + weights[k]
+                if stamp[neighbor] != epoch:
+                    stamp[neighbor] = epoch
+                    heuristic = round(math.dist((xs[neighbor], ys[neighbor]), (tx, ty)))
+                    for f, b, ft, bt in bounds:
+                        if ft - f[neighbor] > heuristic:
+                            heuristic = ft - f[neighbor]
+                        if b[neighbor] - bt > heuristic:
+                            heuristic = b[neighbor] - bt
+                elif new_distance < distance[neighbor]:
+                    heuristic = priority[neighbor] - distance[neighbor]  # same node, same heuristic
+                else:
+                    continue
+                distance[neighbor] = new_distance
+                path_from[neighbor] = current
+                new_priority = new_distance + heuristic
+                priority[neighbor] = new_priority
+                frontier.push(new_priority, neighbor)
+
+        return []
+
+    def find_path_bidirectional(self, source: int, target: int, cost, only_land=False, only_water=False) -> List[int]:
+        """
+        Same result as find_path, with one A* search from each end that meet in the middle.
+        The forward search is guided by the landmark bounds towards target, the backward one
+        by the bounds away from source, each with only the landmarks that bound this pair best.
+        Returns the ids on the path from source to target, or an empty list if there is none.
+        """
+        if not self.is_reachable(source, target, only_land=only_land, only_water=only_water):
+            self.rejected_searches["land" if only_land else "water" if only_water else "any"] += 1
+            return []
+        if source == target:
+            return [source]
+
+        offsets = self._offsets
+        indices = self._indices
+        weights = self._edge_costs[cost]
+        reverse_edges = self._reverse_edges
+        is_water = self._is_water
+
+        landmarks = self.landmarks.get(cost)
+        to_target = landmarks.towards(target) if landmarks is not None else []
+        from_source = landmarks.away_from(source) if landmarks is not None else []
+        to_target.sort(key=lambda l: max(l[2] - l[0][source], l[1][source] - l[3]), reverse=True)
+        from_source.sort(key=lambda l: max(l[0][target] - l[2], l[3] - l[1][target]), reverse=True)
+        to_target = to_target[:ACTIVE_LANDMARKS]
+        from_source = from_source[:ACTIVE_LANDMARKS]
+
+        self._epoch += 1
+        epoch = self._epoch
+        distance = self._distance
+        path_from = self._path_from
+        heuristic = self._heuristic
+        stamp = self._stamp
+        backward_distance = self._backward_distance
+        backward_path_from = self._backward_path_from
+        backward_heuristic = self._backward_heuristic
+        backward_stamp = self._backward_stamp
+        stamp[source] = epoch
+        distance[source] = 0
+        path_from[source] = -1
+        heuristic[source] = 0
+        backward_stamp[target] = epoch
+        backward_distance[target] = 0
+        backward_path_from[target] = -1
+        backward_heuristic[target] = 0
+        frontier = [(0, source)]
+        backward_frontier = [(0, target)]
+
+        best = math.inf
+        meeting = -1
+        while frontier and backward_frontier:
+            # every path cheaper than best is still ahead of both searches
+            if frontier[0][0] >= best or backward_frontier[0][0] >= best:
+                break
+
+            if len(frontier) <= len(backward_frontier):
+                current_priority, current = heappop(frontier)
+                current_distance = distance[current]
+                if current_priority != current_distance + heuristic[current]:
+                    continue  # outdated entry, node was reached cheaper since
+                for k in range(offsets[current], offsets[current + 1]):
+                    neighbor = indices[k]
+                    if only_land and is_water[neighbor]:
+                        continue
+                    elif only_water and not is_water[neighbor]:
+                        continue
+                    new_distance = current_distance + weights[k]
+                    if stamp[neighbor] != epoch:
+                        stamp[neighbor] = epoch
+                        distance[neighbor] = math.inf
+                        h = 0
+                        for f, b, ft, bt in to_target:
+                            if ft - f[neighbor] > h:
+                                h = ft - f[neighbor]
+                            if b[neighbor] - bt > h:
+                                h = b[neighbor] - bt
+                        heuristic[neighbor] = h
+                    elif new_distance >= distance[neighbor]:
+                        continue
+                    new_priority = new_distance + heuristic[neighbor]
+                    if new_priority >= best:
+                        continue  # can't lead to a cheaper path, also drops nodes that can't reach target
+                    distance[neighbor] = new_distance
+                    path_from[neighbor] = current
+                    heappush(frontier, (new_priority, neighbor))
+                    if backward_stamp[neighbor] == epoch and new_distance + backward_distance[neighbor] < best:
+                        best = new_distance + backward_distance[neighbor]
+                        meeting = neighbor
+            else:
+                current_priority, current = heappop(backward_frontier)
+                current_distance = backward_distance[current]
+                if current_priority != current_distance + backward_heuristic[current]:
+                    continue
+                for k in range(offsets[current], offsets[current + 1]):
+                    neighbor = indices[k]
+                    # every node after the source has to fit the restriction
+                    if neighbor != source:
+                        if only_land and is_water[neighbor]:
+                            continue
+                        elif only_water and not is_water[neighbor]:
+                            continue
+                    new_distance = current_distance + weights[reverse_edges[k]]
+                    if backward_stamp[neighbor] != epoch:
+                        backward_stamp[neighbor] = epoch
+                        backward_distance[neighbor] = math.inf
+                        h = 0
+                        for f, b, fs, bs in from_source:
+                            if f[neighbor] - fs > h:
+                                h = f[neighbor] - fs
+                            if bs - b[neighbor] > h:
+                                h = bs - b[neighbor]
+                        backward_heuristic[neighbor] = h
+                    elif new_distance >= backward_distance[neighbor]:
+                        continue
+                    new_priority = new_distance + backward_heuristic[neighbor]
+                    if new_priority >= best:
+                        continue
+                    backward_distance[neighbor] = new_distance
+                    backward_path_from[neighbor] = current
+                    heappush(backward_frontier, (new_priority, neighbor))
+                    if stamp[neighbor] == epoch and new_distance + distance[neighbor] < best:
+                        best = new_distance + distance[neighbor]
+                        meeting = neighbor
+
+        if meeting == -1:
+            return []
+        path = []
+        node = meeting
+        while node != -1:
+            path.append(node)
+            node = path_from[node]
+        path.reverse()
+        node = backward_path_from[meeting]
+        while node != -1:
+            path.append(node)
+            node = backward_path_from[node]
+        return path
+
+    def search_tree(self, source: int, cost, only_land=False, only_water=False) -> "SearchTree":
+        """
+        One-to-many search from source, see SearchTree.
+        """
+        return SearchTree(self, source, cost, only_land=only_land, only_water=only_water)
+
+    def multi_source_search(self, sources: List[int], labels: List[int], cost) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Dijkstra from all sources at once. Every reached node gets the label of
+        its closest source and the distance to it, unreached nodes get -1.
+        Edges are walked backwards, so distances are those of travelling from
+        the node to the source, like a search from the node would measure them.
+        """
+        distance, label, _ = self._backward_search(sources, labels, cost)
+        distances = np.array(distance, dtype=np.float64)
+        distances[np.isinf(distances)] = -1
+        return np.array(label, dtype=np.int32), distances
+
+    def towards_closest(self, targets: List[int], cost) -> tuple[List[float], List[int]]:
+        """
+        Shortest paths from every node to its closest target, in one search.
+        Returns the distance of every node to its closest target, math.inf if none
+        can be reached, and the next node on the way there, -1 at the targets.
+        """
+        distance, _, next_node = self._backward_search(targets, [0] * len(targets), cost)
+        return distance, next_node
+
+    def _backward_search(self, sources: List[int], labels: List[int], cost) -> tuple[List[float], List[int], List[int]]:
+        offsets = self._offsets
+        indices = self._indices
+        weights = self._edge_costs[cost]
+        reverse_edges = self._reverse_edges
+
+        distance: List[float] = [math.inf] * self.size
+        label: List[int] = [-1] * self.size
+        next_node: List[int] = [-1] * self.size
+        frontier = []
+        for source, source_label in zip(sources, labels):
+            distance[source] = 0
+            label[source] = source_label
+            frontier.append((0, source))
+        frontier.sort()
+
+        while frontier:
+            current_distance, current = heappop(frontier)
+            if current_distance > distance[current]:
+                continue  # outdated entry, node was reached cheaper since
+
+            current_label = label[current]
+            for k in range(offsets[current], offsets[current + 1]):
+                neighbor = indices[k]
+                new_distance = current_distance + weights[reverse_edges[k]]
+                if new_distance < distance[neighbor]:
+                    distance[neighbor] = new_distance
+                    label[neighbor] = current_label
+                    next_node[neighbor] = current
+                    heappush(frontier, (new_distance, neighbor))
+
+        return distance, label, next_node
+
+class SearchTree(object):
+    """
+    Dijkstra from one source that only runs as far as it has to: asking for a target
+    settles nodes until the target is settled, asking for the next one continues from there.
+    So one search answers a whole set of targets, which may be picked while going.
+    The path to a node does not depend on which targets were asked for before.
+    """
+    def __init__(self, graph: WorldGraph, source: int, cost, only_land=False, only_water=False):
+        self.graph = graph
+        self.source = source
+        self.only_land = only_land
+        self.only_water = only_water
+        self.weights = graph._edge_costs[cost]
+
+        # own state instead of the epoch stamped arrays of the graph,
+        # so other searches can run while this one is kept around
+        self.distance: Dict[int, int] = {source: 0}
+        self.path_from: Dict[int, int] = {source: -1}
+        self.settled = set()
+        self.frontier = [(0, source)]
+
+    def distance_to(self, target: int) -> int|None:
+        """
+        Shortest distance from the source to target, None if there is no path.
+        """
+        if target in self.settled:
+            return self.distance[target]
+        if not self.graph.is_reachable(self.source, target, only_land=self.only_land, only_water=self.only_water):
+            self.graph.rejected_searches["land" if self.only_land else "water" if self.only_water else "any"] += 1
+            return None
+
+        offsets = self.graph._offsets
+        indices = self.graph._indices
+        is_water = self.graph._is_water
+        weights = self.weights
+        only_land = self.only_land
+        only_water = self.only_water
+        distance = self.distance
+        path_from = self.path_from
+        settled = self.settled
+        frontier = self.frontier
+        while frontier:
+            current_distance, current = heappop(frontier)
+            if current_distance > distance[current]:
+                continue  # outdated entry, node was reached cheaper since
+            settled.add(current)
+            for k in range(offsets[current], offsets[current + 1]):
+                neighbor = indices[k]
+                if only_land and is_water[neighbor]:
+                    continue
+                elif only_water and not is_water[neighbor]:
+                    continue
+                new_distance = current_distance + weights[k]
+                if new_distance < distance.get(neighbor, math.inf):
+                    distance[neighbor] = new_distance
+                    path_from[neighbor] = current
+                    heappush(frontier, (new_distance, neighbor))
+            if current == target:
+                return current_distance
+        return None
+
+    def path_to(self, target: int) -> List[int]:
+        """
+        Ids on a shortest path from the source to target, empty if there is none.
+        """
+        if self.distance_to(target) is None:
+            return []
+        path = []
+        node = target
+        while node != -1:
+            path.append(node)
+            node = self.path_from[node]
+        return list(reversed(path))
@@ -0,0 +1,27 @@
+#!/usr/bin/env python3
+
+from vindonissa.game_objects.cell import Cell
+from typing import List
+
+CONTINENT_MIN_SHARE = 0.1  # share of all land cells a landmass needs to count as continent
+
+
+class Landmass(object):
+    def __init__(self, cells: List[Cell]):
+        self.cells = cells
+
+
+class Continent(Landmass):
+    """
+    A collection of connected land-cells making up a large part of the land.
+    """
+    def __init__(self, cells):
+        super().__init__(cells)
+
+
+class Island(Landmass):
+    """
+    A collection of connected land-cells too small to be a continent.
+    """
+    def __init__(self, cells):
+        super().__init__(cells)
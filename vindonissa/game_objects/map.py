@@ -1,33 +1,74 @@
 #!/usr/bin/env python3
 
 import math
-from typing import List, Dict
-import sys
+from typing import Callable, List, Dict
+
+import numpy as np
 
 from vindonissa.game_objects.character import Character
 from vindonissa.game_objects.family import Family, Dynasty
 from vindonissa.game_objects.cell import Cell
-from vindonissa.util.priority_queues import CellPriorityQueue, CityPriorityQueue
+from vindonissa.game_objects.graph import WorldGraph
+from vindonissa.game_objects.city_graph import CityGraph
+from vindonissa.game_objects.region_graph import RegionGraph, MIN_CELLS as REGION_GRAPH_MIN_CELLS
+from vindonissa.util.priority_queues import QUEUE_TYPES
+from vindonissa.util.spatial_index import SpatialIndex
+from vindonissa.util.lru_cache import LRUCache
+from vindonissa.util.union_find import label_components
 from vindonissa.game_objects.river import River
 from vindonissa.game_objects.city import WayNode, City, Port
-from vindonissa.game_objects.waterbody import Lake, Ocean
+from vindonissa.game_objects.waterbody import WaterBody, Lake, Ocean
+from vindonissa.game_objects.landmass import CONTINENT_MIN_SHARE, Landmass, Continent, Island
 from vindonissa.game_objects.culture import Culture, CultureGroup
+from vindonissa.static_data.movement_costs import PRECOMPUTED_COSTS
 
 
 SEARCH_MAX_DISTANCE = 9999999
+# lowest share of its cost an edge keeps with the wealth modifier, keeps the heuristic admissible there
+WEALTH_MODIFIER_MIN_FACTOR = 0.7
+PATH_CACHE_SIZE = 4096  # paths kept by the path cache
+
+
+def wealth_factor(wealth: float, traderoute_counter: int, half_avg_wealth: float, z: float) -> float:
+    """
+    The wealth modifier divides the cost of moving to a city (or one of its ports) by this.
+    """
+    # factor is 1 if city's wealth is half of average wealth, 2 if doubl
+    x = wealth - half_avg_wealth
+    if x <= 0:
+        factor = 1
+    else:
+        share = x / z
+        factor = min(1 + share, 2)
+
+    t = traderoute_counter
+    if t > 0:
+        factor = factor * ( t / (t*t) )
+    return factor
 
 
 class WorldMap(object):
     def __init__(self, width: int, height: int):
         self.width: int = width
         self.height: int = height
-        sys.setrecursionlimit(width * height)
 
         # cells
         self.cells: List[Cell] = []
         self.cells_by_id: Dict[int, Cell] = None  # type: ignore
         self.land_cells: List[Cell] = []
 
+        # cell adjacency in CSR form over cell ids,
+        # neighbors of cell i are neighbor_indices[neighbor_offsets[i]:neighbor_offsets[i+1]]
+        self.neighbor_offsets: np.ndarray = np.zeros(1, dtype=np.int32)
+        self.neighbor_indices: np.ndarray = np.zeros(0, dtype=np.int32)
+        self.fill_mask = bytearray()  # reused by flood_fill
+
+        # connected water and land, labels index into water_bodies and landmasses, -1 where not applicable
+        self.water_bodies: List[WaterBody] = []
+        self.landmasses: List[Landmass] = []
+        self.water_body_labels: np.ndarray = np.zeros(0, dtype=np.int32)
+        self.landmass_labels: np.ndarray = np.zeros(0, dtype=np.int32)
+
         # objects(?)
         self.rivers: List[River] = []
         self.cities: List[City] = []
@@ -42,14 +83,32 @@ class WorldMap(object):
         # trade
         self.trade_endpoints = []
         self.traderoutes = []  # currently only for viz
+        self.traderoute_wealth_basis: List[float] = []  # wealth_no_trade of each city the trade routes were searched with
 
         # only visuals
         self.roads: List[List[Cell]] = []
         self.sea_roads: List[List[Cell]] = []
 
         # pathfinding
-        self.cell_priority_queue: CellPriorityQueue = CellPriorityQueue() 
-        self.city_priority_queue: CityPriorityQueue = CityPriorityQueue()
+        self.priority_queues = {}  # one reusable queue per queue type
+        self.graph: WorldGraph|None = None
+        self.region_graphs: Dict[Callable, RegionGraph] = {}  # per cost function, for long paths
+        # per cost function: closest city id and distance to it for each cell id
+        self.city_regions: Dict[Callable, tuple[np.ndarray, np.ndarray]] = {}
+        self.search_epoch = 0  # nodes with an older search_epoch count as not yet reached
+        # city/port network in array form, and distances between all pairs of cities, indexed by city id
+        self.city_graph: CityGraph|None = None
+        self.city_distances: np.ndarray|None = None
+        # bumped whenever cells, rivers or city territories change, cached results of older versions are outdated
+        self.version = 0
+        # recent paths and their costs, see cached_path
+        self.path_cache: LRUCache[tuple[list, int]] = LRUCache(PATH_CACHE_SIZE)
+        self.path_cache_version = 0
+
+        # spatial lookups, built on demand
+        self.cell_index: SpatialIndex[Cell]|None = None
+        self.city_index: SpatialIndex[City]|None = None
+        self.port_index: SpatialIndex[Port]|None = None
 
     def setup_cells(self):
         self.cells_by_id: Dict[int, Cell] = {cell.id: cell for cell in self.cells}
@@ -81,13 +140,82 @@ class WorldMap(object):
         Inside holds all cells that were already processed.
         Condition is a function that a cell must return
         True for to be added to the fill.
+        Iterative, but adds cells in the same order a recursive fill would.
         """
+        # bitmap over cell ids, only the filled cells are set and reset again afterwards
+        if len(self.fill_mask) < len(self.neighbor_offsets) - 1:
+            self.fill_mask = bytearray(len(self.neighbor_offsets) - 1)
+        visited = self.fill_mask
+        for c in inside:
+            visited[c.id] = 1
+
+        visited[cell.id] = 1
         inside.append(cell)
-        for neighbor in cell.neighbors:
-            if neighbor in inside:
-                continue
-            if condition(neighbor):
-                self.flood_fill(neighbor, inside, condition)
+        stack = [iter(cell.neighbors)]
+        while stack:
+            for neighbor in stack[-1]:
+                if visited[neighbor.id]:
+                    continue
+                if condition(neighbor):
+                    visited[neighbor.id] = 1
+                    inside.append(neighbor)
+                    stack.append(iter(neighbor.neighbors))
+                    break
+            else:
+                stack.pop()
+
+        for c in inside:
+            visited[c.id] = 0
+        return inside
+
+    def setup_water_bodies_and_landmasses(self):
+        """
+        Label all connected water and land cells
+        and create the oceans, lakes, continents and islands.
+        """
+        exists = np.zeros(len(self.neighbor_offsets) - 1, dtype=bool)
+        is_water = np.zeros(len(self.neighbor_offsets) - 1, dtype=bool)
+        for cell in self.cells:
+            exists[cell.id] = True
+            is_water[cell.id] = cell.is_water
+
+        # the same labels the pathfinding uses for its only_water and only_land searches
+        self.water_body_labels = label_components(self.neighbor_offsets, self.neighbor_indices, exists & is_water)
+        self.landmass_labels = label_components(self.neighbor_offsets, self.neighbor_indices, exists & ~is_water)
+
+        water_cells: List[List[Cell]] = [[] for _ in range(self.water_body_labels.max(initial=-1) + 1)]
+        land_cells: List[List[Cell]] = [[] for _ in range(self.landmass_labels.max(initial=-1) + 1)]
+        for cell in self.cells:
+            if cell.is_water:
+                water_cells[self.water_body_labels[cell.id]].append(cell)
+            else:
+                land_cells[self.landmass_labels[cell.id]].append(cell)
+
+        self.water_bodies = []
+        for inside in water_cells:
+            if any([c.is_border_cell for c in inside]):
+                wb = Ocean(inside)
+            else:
+                wb = Lake(inside)
+            for cell in inside:
+                cell.water_body = wb
+            self.water_bodies.append(wb)
+
+        self.landmasses = []
+        for inside in land_cells:
+            if len(inside) >= CONTINENT_MIN_SHARE * len(self.land_cells):
+                lm = Continent(inside)
+            else:
+                lm = Island(inside)
+            for cell in inside:
+                cell.landmass = lm
+            self.landmasses.append(lm)
+
+    def same_landmass(self, a: Cell, b: Cell) -> bool:
+        return not a.is_water and self.landmass_labels[a.id] == self.landmass_labels[b.id]
+
+    def same_water_body(self, a: Cell, b: Cell) -> bool:
+        return a.is_water and self.water_body_labels[a.id] == self.water_body_labels[b.id]
 
     def setup_cells2(self):
         """
@@ -112,23 +240,168 @@ class WorldMap(object):
                     cell.is_deep_water = False
                     neighbor.is_coastal = True
 
-        # setup which cells are oceans and lakes and connected to each other
-        for cell in self.cells:
-            if not cell.is_water:
-                continue
-            if cell.water_body is not None:
-                continue
-            inside: List[Cell] = []
-            self.flood_fill(cell, inside, lambda x: x.is_water)
-            if any([c.is_border_cell for c in inside]):
-                wb = Ocean(inside)
+        # setup which cells are oceans, lakes, continents and islands
+        self.setup_water_bodies_and_landmasses()
+
+    def setup_graph(self):
+        """
+        Build the array graph used for pathfinding on cells.
+        Needs to be called after the rivers are placed, as they change the edge costs.
+        """
+        self.graph = WorldGraph(self.cells, self.neighbor_offsets, self.neighbor_indices)
+        for cost in PRECOMPUTED_COSTS:
+            self.graph.add_edge_costs(cost, self.cells_by_id)
+            self.graph.add_landmarks(cost)
+
+    def invalidate_cells(self, cells: List[Cell]):
+        """
+        Has to be called whenever terrain, forests or rivers of cells change,
+        so the precomputed edge costs stay correct.
+        """
+        if self.graph is not None:
+            self.graph.update_cells(cells, self.cells_by_id)
+        self.region_graphs.clear()
+        self.city_regions.clear()
+        self.version += 1
+
+    def invalidate_territories(self):
+        """
+        Has to be called whenever cities are placed or their territory or connections change.
+        """
+        self.city_regions.clear()
+        self.city_graph = None
+        self.city_distances = None
+        self.city_index = None
+        self.port_index = None
+        self.version += 1
+
+    def cached_path(self, key: tuple, search: Callable[[], tuple[list, int]]) -> tuple[list, int]:
+        """
+        Path and its cost for key from the path cache, running search if it is not in there.
+        The cache is emptied once the map version changed.
+        """
+        if self.path_cache_version != self.version:
+            self.path_cache.clear()
+            self.path_cache_version = self.version
+        result = self.path_cache.get(key)
+        if result is None:
+            result = search()
+            self.path_cache.put(key, result)
+        return result
+
+    def get_region_graph(self, cost) -> RegionGraph:
+        """
+        Regions and portals of the cell graph for a cost function with precomputed edge costs.
+        """
+        assert self.graph is not None
+        if cost not in self.region_graphs:
+            self.region_graphs[cost] = RegionGraph(self.graph, cost)
+        return self.region_graphs[cost]
+
+    def get_city_regions(self, cost) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Label every cell with its closest city and the distance to it,
+        in one search starting from the territory of all cities.
+        Results are cached per cost function.
+        """
+        assert self.graph is not None
+        if cost not in self.city_regions:
+            territory = [cell for cell in self.cells if cell.city is not None]
+            self.city_regions[cost] = self.graph.multi_source_search(
+                [cell.id for cell in territory], [cell.city.id for cell in territory], cost)  # type: ignore
+        return self.city_regions[cost]
+
+    def get_cell_index(self) -> SpatialIndex[Cell]:
+        """
+        Nearest neighbor and radius queries over the cell centers.
+        """
+        if self.cell_index is None:
+            self.cell_index = SpatialIndex(self.cells, [(c.x, c.y) for c in self.cells])
+        return self.cell_index
+
+    def get_city_index(self) -> SpatialIndex[City]:
+        """
+        Nearest neighbor and radius queries over the city centers.
+        """
+        if self.city_index is None:
+            self.city_index = SpatialIndex(self.cities, [(c.cell.x, c.cell.y) for c in self.cities])
+        return self.city_index
+
+    def get_port_index(self) -> SpatialIndex[Port]:
+        """
+        Nearest neighbor and radius queries over all ports.
+        """
+        if self.port_index is None:
+            ports = [p for c in self.cities for p in c.ports]
+            self.port_index = SpatialIndex(ports, [(p.cell.x, p.cell.y) for p in ports])
+        return self.port_index
+
+    def get_city_graph(self) -> CityGraph:
+        """
+        The city/port network with its landmarks, built once the cities are connected.
+        """
+        if self.city_graph is None:
+            self.city_graph = CityGraph(self.cities)
+            self.city_graph.add_landmarks()
+        return self.city_graph
+
+    def get_city_distances(self, cache_path: str|None = None, processes: int|None = None) -> np.ndarray:
+        """
+        Matrix of the distances between all cities over land and sea roads, inf if unreachable.
+        Computed once after the cities are connected and saved along with the map.
+        cache_path: Optional .npz file to reuse the matrix across runs on the same map.
+        processes: Number of processes to compute it with.
+        """
+        if self.city_distances is None:
+            city_graph = self.get_city_graph()
+            if cache_path is not None:
+                self.city_distances = city_graph.load_or_compute_city_distances(cache_path, processes=processes)
             else:
-                wb = Lake(inside)
-            for cell in inside:
-                cell.water_body = wb
+                self.city_distances = city_graph.city_distance_matrix(processes=processes)
+        return self.city_distances
+
+    def city_distance(self, source: City, target: City) -> float|None:
+        """
+        Same as city_to_city_dist, looked up in the distance matrix once it was computed.
+        Until then, e.g. after the territories changed, the contraction hierarchy answers,
+        so single lookups don't have to compute the whole matrix again.
+        Counts the sea road cost from city to port like the search does.
+        """
+        if self.city_distances is None:
+            return self.city_to_city_fast_dist(source, target)
+        distance = float(self.city_distances[source.id, target.id])
+        if math.isinf(distance):
+            return None  # no path found
+        return distance
+
+    def path_cost(self, path: List[Cell], cost) -> int:
+        """
+        Sum up the cost of moving along the path.
+        """
+        if self.graph is not None and self.graph.has_edge_costs(cost):
+            return sum([self.graph.edge_cost(cost, current.id, next.id) for current, next in zip(path[:-1], path[1:])])
+        return sum([cost(current, next) for current, next in zip(path[:-1], path[1:])])
 
     def get_cell_by_id(self, idx):
         return self.cells_by_id[idx]
+
+    def get_priority_queue(self, queue: str):
+        """
+        Return an empty priority queue of the given type, see util.priority_queues.QUEUE_TYPES.
+        """
+        if queue not in self.priority_queues:
+            self.priority_queues[queue] = QUEUE_TYPES[queue]()
+        frontier = self.priority_queues[queue]
+        frontier.clear()
+        return frontier
+
+    def new_search_epoch(self) -> int:
+        """
+        Start a new search. Instead of resetting the distance of every node,
+        nodes are stamped with the epoch of the search that last reached them.
+        """
+        self.search_epoch += 1
+        return self.search_epoch
     
     def get_closest_city(self, cell: Cell, cost, debug=False) -> City|None:
         """
@@ -138,11 +411,16 @@ class WorldMap(object):
 
         if cell.city is not None:
             return cell.city
-        
-        for c in self.cells:
-            c.distance = SEARCH_MAX_DISTANCE
+
+        if self.graph is not None and self.graph.has_edge_costs(cost):
+            labels, _ = self.get_city_regions(cost)
+            city_id = labels[cell.id]
+            return self.cities[city_id] if city_id >= 0 else None
+
+        epoch = self.new_search_epoch()
 
         frontier: List[Cell] = []
+        cell.search_epoch = epoch
         cell.distance = 0
         frontier.append(cell)
         while len(frontier) > 0:
@@ -152,6 +430,9 @@ class WorldMap(object):
                 return current.city
 
             for neighbor in current.neighbors:
+                if neighbor.search_epoch != epoch:
+                    neighbor.search_epoch = epoch
+                    neighbor.distance = SEARCH_MAX_DISTANCE
                 distance = current.distance
                 distance += cost(current, neighbor)
                 if neighbor.distance == SEARCH_MAX_DISTANCE:
@@ -163,39 +444,104 @@ class WorldMap(object):
 
         return None
 
-    def city_to_city_dist(self, source: WayNode, target: WayNode, only_land=False, only_water=False) -> int|None:
-        path = self.city_to_city_path(source, target, only_land=only_land, only_water=only_water)
+    def city_to_city_dist(self, source: WayNode, target: WayNode, only_land=False, only_water=False, queue: str = "heap") -> int|None:
+        path, cost = self.cached_path(
+            (source, target, only_land, only_water),
+            lambda: self._city_path_with_cost(source, target, only_land=only_land, only_water=only_water, queue=queue))
+        if not path:
+            return None  # no path found
+        return cost
+
+    def _city_path_with_cost(self, source: WayNode, target: WayNode, **kwargs) -> tuple[List[WayNode], int]:
+        path = self._city_to_city_path(source, target, **kwargs)
+        cost = 0
+        for current, next in zip(path[:-1], path[1:]):
+            cost += current.get_distance(next)
+        return path, cost
+
+    def city_to_city_fast_path(self, source: WayNode, target: WayNode, only_land=False, only_water=False, apply_wealth_modifier=False) -> List[WayNode]:
+        """
+        Same as city_to_city_path, but answered by the contraction hierarchy of the city graph.
+        The hierarchy only knows the plain costs of the whole network,
+        restricted or wealth modified searches are passed on to city_to_city_path.
+        """
+        if only_land or only_water or apply_wealth_modifier:
+            return self.city_to_city_path(source, target, only_land=only_land, only_water=only_water, apply_wealth_modifier=apply_wealth_modifier)
+        _, path = self.get_city_graph().shortest_path(source, target)
+        return path
+
+    def city_to_city_fast_dist(self, source: WayNode, target: WayNode) -> int|None:
+        """
+        Same as city_to_city_dist, but answered by the contraction hierarchy of the city graph.
+        """
+        distance, path = self.get_city_graph().shortest_path(source, target)
         if not path:
             return None  # no path found
-        else:
-            cost = 0
-            for current, next in zip(path[:-1], path[1:]):
-                cost += current.get_distance(next)
-            return cost
+        return int(distance)
 
-    def city_to_city_path(self, source: WayNode, target: WayNode, only_land=False, only_water=False, apply_wealth_modifier=False) -> List[WayNode]:
+    def city_to_city_path(self, source: WayNode, target: WayNode, only_land=False, only_water=False, apply_wealth_modifier=False, queue: str = "heap", cached=True, wealth: List[float]|None = None) -> List[WayNode]:
+        """
+        cached: Look the path up in the path cache first and keep it there.
+        Wealth modified paths change with the wealth of the cities and are never cached.
+        wealth: wealth_no_trade of every city by id for the wealth modifier, if already known.
+        """
+        if not cached or apply_wealth_modifier:
+            return self._city_to_city_path(source, target, only_land=only_land, only_water=only_water, apply_wealth_modifier=apply_wealth_modifier, queue=queue, wealth=wealth)
+        path, _ = self.cached_path(
+            (source, target, only_land, only_water),
+            lambda: self._city_path_with_cost(source, target, only_land=only_land, only_water=only_water, queue=queue))
+        return list(path)
+
+    def wealth_modified_paths(self, pairs: List[tuple[City, City]], wealth: List[float], traderoute_counters: List[int], pool=None) -> List[List[WayNode]]:
+        """
+        Paths like city_to_city_path with apply_wealth_modifier for many pairs at once,
+        with the trade route counters of the cities fixed to the given ones.
+        The pairs are searched on the city graph, spread over the pool from CityGraph.path_pool if given.
+        wealth, traderoute_counters: Per city id.
+        """
+        city_graph = self.get_city_graph()
+        average_wealth = sum(wealth) / len(self.cities)
+        half_avg_wealth = average_wealth * 0.5
+        z = average_wealth * 2 - half_avg_wealth
+        factors = [wealth_factor(wealth[city.id], traderoute_counters[city.id], half_avg_wealth, z) for city in self.cities]
+        return city_graph.wealth_modified_paths(pairs, factors, WEALTH_MODIFIER_MIN_FACTOR, pool=pool)
+
+    def _city_to_city_path(self, source: WayNode, target: WayNode, only_land=False, only_water=False, apply_wealth_modifier=False, queue: str = "heap", wealth: List[float]|None = None) -> List[WayNode]:
         """
         apply_wealth_modifier: Modifies distance by relative city wealth.
+        queue: Type of priority queue used for the search. Defaults to a heap,
+        the city costs are too large and spread out for the bucket queue.
+        The heuristic uses the landmarks of the city graph.
         """
         if apply_wealth_modifier:
-            average_wealth = sum([c.wealth_no_trade for c in self.cities]) / len(self.cities)
+            if wealth is None:
+                wealth = [c.wealth_no_trade for c in self.cities]
+            average_wealth = sum(wealth) / len(self.cities)
             half_avg_wealth = average_wealth * 0.5
             double_avg_wealth = average_wealth * 2
             z = double_avg_wealth - half_avg_wealth
         
         path = []
 
-        self.city_priority_queue.clear()
+        city_graph = self.get_city_graph()
+        node_index = city_graph.index
+        if not city_graph.is_reachable(node_index[source], node_index[target], only_land=only_land, only_water=only_water):
+            city_graph.rejected_searches["land" if only_land else "water" if only_water else "any"] += 1
+            return path
+        bounds = city_graph.landmarks.towards(node_index[target])
 
-        for city in self.cities:
-            city.distance = SEARCH_MAX_DISTANCE
-            for port in city.ports:
-                port.distance = SEARCH_MAX_DISTANCE
-        
+        frontier = self.get_priority_queue(queue)
+
+        epoch = self.new_search_epoch()
+
+        source.search_epoch = epoch
         source.distance = 0
-        self.city_priority_queue.enqueue(source)
-        while self.city_priority_queue.count > 0:
-            current = self.city_priority_queue.dequeue()
+        source.search_heuristic = 0  # could be left over from an earlier search
+        frontier.push(source.search_priority, source)
+        while len(frontier) > 0:
+            priority, current = frontier.pop()
+            if priority != current.search_priority:
+                continue  # outdated entry, node was reached cheaper since
             
             # end condition
             if current == target:
@@ -223,28 +569,17 @@ class WorldMap(object):
                 if apply_wealth_modifier:
                     assert type(source) == City
                     if type(neighbor) == City:
-                        w = neighbor.wealth_no_trade
+                        w = wealth[neighbor.id]  # type: ignore
                         t = neighbor.traderoute_counter
                     elif type(neighbor) == Port:
-                        w = neighbor.city.wealth_no_trade
+                        w = wealth[neighbor.city.id]  # type: ignore
                         t = neighbor.city.traderoute_counter
                     else:
                         w = 0
                         t = 0
-                    
-                    # factor is 1 if city's wealth is half of average wealth, 2 if doubl
-                    x = w - half_avg_wealth  # type: ignore
-                    if x <= 0:
-                        wealth_factor = 1
-                    else:
-                        share = x / z  # type: ignore
-                        wealth_factor = min(1 + share, 2)
-
-                    if t > 0:
-                        wealth_factor = wealth_factor * ( t / (t*t) )
 
                     # wealth factor is lower than 1 if source is richer, else over 1
-                    cost = cost * 0.5 + ((cost / wealth_factor) * 0.5)
+                    cost = cost * 0.5 + ((cost / wealth_factor(w, t, half_avg_wealth, z)) * 0.5)  # type: ignore
                     cost = round(cost)
 
                 #print("neigh", neighbor, cost)
@@ -253,36 +588,124 @@ class WorldMap(object):
                     continue
                 elif only_water and not type(neighbor) == Port:
                     continue
+                if neighbor.search_epoch != epoch:
+                    neighbor.search_epoch = epoch
+                    neighbor.distance = SEARCH_MAX_DISTANCE
                 distance = current.distance
                 distance += cost
                 if neighbor.distance == SEARCH_MAX_DISTANCE:
+                    # landmark lower bound on the remaining distance
+                    idx = node_index[neighbor]
+                    heuristic = 0
+                    for f, b, ft, bt in bounds:
+                        heuristic = max(heuristic, ft - f[idx], b[idx] - bt)
+                    if heuristic == math.inf:
+                        continue  # dead end, the target can't be reached from there
                     neighbor.distance = distance
                     neighbor.path_from = current
-                    neighbor.search_heuristic = round(math.dist((neighbor.cell.x, neighbor.cell.y), (target.cell.x, target.cell.y)) * 20)
-                    #print(distance, neighbor.search_heuristic) # NOTE: We need to get find a good amount for the heuristic. The heuristic also depends on the average cost between routes
-                    self.city_priority_queue.enqueue(neighbor)
+                    if apply_wealth_modifier:
+                        heuristic = math.floor(heuristic * WEALTH_MODIFIER_MIN_FACTOR)
+                    neighbor.search_heuristic = heuristic
+                    frontier.push(neighbor.search_priority, neighbor)
                 elif distance < neighbor.distance:
-                    old_prio = neighbor.search_priority
                     neighbor.distance = distance
                     neighbor.path_from = current
-                    self.city_priority_queue.change(neighbor, old_prio)
+                    frontier.push(neighbor.search_priority, neighbor)
 
         return list(reversed(path))
 
     
-    def cell_to_cell_path(self, source: Cell, target: Cell, cost, only_land=False, only_water=False) -> List[Cell]:
+    def cell_to_cell_dist(self, source: Cell, target: Cell, cost, only_land=False, only_water=False, hierarchical=False) -> int|None:
+        path, distance = self.cached_path(
+            (source.id, target.id, cost, only_land, only_water, hierarchical),
+            lambda: self._cell_path_with_cost(source, target, cost, only_land=only_land, only_water=only_water, hierarchical=hierarchical))
+        if not path:
+            return None  # no path found
+        return distance
+
+    def cell_to_cell_path(self, source: Cell, target: Cell, cost, only_land=False, only_water=False, queue: str|None = None, hierarchical=False, bidirectional=False, cached=True) -> List[Cell]:
+        """
+        cached: Look the path up in the path cache first and keep it there.
+        The queue and bidirectional options don't change the path cost,
+        so they share the cached paths.
+        """
+        if not cached:
+            return self._cell_to_cell_path(source, target, cost, only_land=only_land, only_water=only_water, queue=queue, hierarchical=hierarchical, bidirectional=bidirectional)
+        path, _ = self.cached_path(
+            (source.id, target.id, cost, only_land, only_water, hierarchical),
+            lambda: self._cell_path_with_cost(source, target, cost, only_land=only_land, only_water=only_water, queue=queue, hierarchical=hierarchical, bidirectional=bidirectional))
+        return list(path)
+
+    def cell_to_cells_paths(self, source: Cell, targets: List[Cell], cost, only_land=False, only_water=False, with_paths=False) -> List[tuple[int|None, List[Cell]]]:
+        """
+        Distances from source to each of the targets, None for unreachable ones,
+        in one search that stops once all targets are settled.
+        with_paths: Also return the paths, otherwise the path lists stay empty.
+        Cost functions without precomputed edge costs are searched target by target.
+        """
+        if self.graph is None or not self.graph.has_edge_costs(cost):
+            results = []
+            for target in targets:
+                path = self.cell_to_cell_path(source, target, cost, only_land=only_land, only_water=only_water)
+                results.append((self.path_cost(path, cost) if path else None, path if with_paths else []))
+            return results
+
+        tree = self.graph.search_tree(source.id, cost, only_land=only_land, only_water=only_water)
+        results = []
+        for target in targets:
+            distance = tree.distance_to(target.id)
+            path = [self.cells_by_id[idx] for idx in tree.path_to(target.id)] if with_paths and distance is not None else []
+            results.append((distance, path))
+        return results
+
+    def _cell_path_with_cost(self, source: Cell, target: Cell, cost, **kwargs) -> tuple[List[Cell], int]:
+        path = self._cell_to_cell_path(source, target, cost, **kwargs)
+        return path, self.path_cost(path, cost)
+
+    def _cell_to_cell_path(self, source: Cell, target: Cell, cost, only_land=False, only_water=False, queue: str|None = None, hierarchical=False, bidirectional=False) -> List[Cell]:
+        """
+        Cost functions with precomputed edge costs are searched on the array graph,
+        any other cost function on the cell objects.
+        queue: Type of priority queue used for the search, defaults to a heap
+        on the array graph and to buckets on the cell objects.
+        hierarchical: Solve long unrestricted paths on the region graph first on big maps,
+        much faster, but the path can be a bit longer than the shortest one.
+        bidirectional: Search from both ends on the array graph, the path costs the same.
+        """
+        if hierarchical and not only_land and not only_water and self.graph is not None and self.graph.has_edge_costs(cost) \
+                and len(self.cells) >= REGION_GRAPH_MIN_CELLS:
+            region_graph = self.get_region_graph(cost)
+            if region_graph.is_long(source.id, target.id) and self.graph.is_reachable(source.id, target.id):
+                path_ids = region_graph.find_path(source.id, target.id)
+                if path_ids:
+                    return [self.cells_by_id[idx] for idx in path_ids]
+
+        if self.graph is not None and self.graph.has_edge_costs(cost):
+            if bidirectional:
+                path_ids = self.graph.find_path_bidirectional(source.id, target.id, cost, only_land=only_land, only_water=only_water)
+            else:
+                path_ids = self.graph.find_path(source.id, target.id, cost, only_land=only_land, only_water=only_water, queue=queue or "heap")
+            return [self.cells_by_id[idx] for idx in path_ids]
+
+        if self.graph is not None and not self.graph.is_reachable(source.id, target.id, only_land=only_land, only_water=only_water):
+            self.graph.rejected_searches["land" if only_land else "water" if only_water else "any"] += 1
+            return []
+
         distance = 0
         path = []
 
-        self.cell_priority_queue.clear()
+        frontier = self.get_priority_queue(queue or "bucket")
 
-        for cell in self.cells:
-            cell.distance = SEARCH_MAX_DISTANCE
-        
+        epoch = self.new_search_epoch()
+
+        source.search_epoch = epoch
         source.distance = 0
-        self.cell_priority_queue.enqueue(source)
-        while self.cell_priority_queue.count > 0:
-            current = self.cell_priority_queue.dequeue()
+        source.search_heuristic = 0  # could be left over from an earlier search
+        frontier.push(source.search_priority, source)
+        while len(frontier) > 0:
+            priority, current = frontier.pop()
+            if priority != current.search_priority:
+                continue  # outdated entry, node was reached cheaper since
             
             # end condition
             if current == target:
@@ -300,17 +723,19 @@ class WorldMap(object):
                     continue
                 elif only_water and not neighbor.is_water:
                     continue
+                if neighbor.search_epoch != epoch:
+                    neighbor.search_epoch = epoch
+                    neighbor.distance = SEARCH_MAX_DISTANCE
                 distance = current.distance
                 distance += cost(current, neighbor)
                 if neighbor.distance == SEARCH_MAX_DISTANCE:
                     neighbor.distance = distance
                     neighbor.path_from = current
                     neighbor.search_heuristic = round(math.dist((neighbor.x, neighbor.y), (target.x, target.y)) * 1)
-                    self.cell_priority_queue.enqueue(neighbor)
+                    frontier.push(neighbor.search_priority, neighbor)
                 elif distance < neighbor.distance:
-                    old_prio = neighbor.search_priority
                     neighbor.distance = distance
                     neighbor.path_from = current
-                    self.cell_priority_queue.change(neighbor, old_prio)
+                    frontier.push(neighbor.search_priority, neighbor)
 
         return list(reversed(path))
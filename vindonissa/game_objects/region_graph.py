@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+
+from heapq import heappush, heappop
+import math
+from typing import Dict, List
+
+from vindonissa.game_objects.graph import WorldGraph
+
+
+REGION_SIZE = 25  # side length of the square regions, in map units
+PORTAL_SPACING = 10  # long border stretches get a portal every this many cells
+MIN_CELLS = 20000  # on smaller maps the direct search is faster than setting up the regions
+
+
+class RegionGraph(object):
+    """
+    Two-level view of the cell graph for long paths (HPA*).
+    Cells are grouped into square regions. Where two regions touch, portal
+    edges are placed along each connected stretch of their border. Within each region
+    the distances between its portals are precomputed, so a long query only
+    searches the small graph of portals and then fills in the cell paths.
+    Paths are close to, but not always exactly, the shortest ones.
+    """
+    def __init__(self, graph: WorldGraph, cost, region_size: float = REGION_SIZE):
+        self.graph = graph
+        self.cost = cost
+        self.region_size = region_size
+
+        offsets = graph._offsets
+        indices = graph._indices
+        weights = graph._edge_costs[cost]
+
+        self.region: List[int] = [-1] * graph.size
+        columns = int(max(graph.x.max(initial=0), 0) // region_size) + 1
+        for idx in range(graph.size):
+            if graph.exists[idx]:
+                self.region[idx] = int(graph._x[idx] // region_size) + columns * int(graph._y[idx] // region_size)
+
+        # cells along the border of each region towards each neighboring region
+        borders: Dict[tuple[int, int], List[int]] = {}
+        for idx in range(graph.size):
+            for neighbor in indices[offsets[idx]:offsets[idx + 1]]:
+                if self.region[neighbor] != self.region[idx]:
+                    border = borders.setdefault((self.region[idx], self.region[neighbor]), [])
+                    if not border or border[-1] != idx:
+                        border.append(idx)
+
+        # portal edges: each connected stretch of border cells is split into pieces
+        # of about PORTAL_SPACING cells, the middle cell of a piece crosses over
+        # with its cheapest edge into the other region
+        self.portals: Dict[int, List[int]] = {}  # region -> its portal cells
+        self.crossings: Dict[int, Dict[int, int]] = {}  # portal -> {portal in other region: edge cost}
+        for (region, other), cells in borders.items():
+            for stretch in self._stretches(cells):
+                stretch.sort(key=lambda idx: (graph._x[idx], graph._y[idx]))
+                pieces = math.ceil(len(stretch) / PORTAL_SPACING)
+                for piece in range(pieces):
+                    portal = stretch[(2 * piece + 1) * len(stretch) // (2 * pieces)]
+                    k = min(
+                        [k for k in range(offsets[portal], offsets[portal + 1]) if self.region[indices[k]] == other],
+                        key=lambda k: weights[k])
+                    self._add_crossing(portal, indices[k], weights[k])
+                    self._add_crossing(indices[k], portal, weights[graph._reverse_edges[k]])
+
+        # distances and paths between the portals of each region, staying inside it
+        self.inner: Dict[int, Dict[int, int]] = {}  # portal -> {portal in same region: distance}
+        self.inner_paths: Dict[int, Dict[int, int]] = {}  # portal -> path_from of its search inside the region
+        for region, portals in self.portals.items():
+            for portal in portals:
+                distance, path_from = self._search_region(portal, region)
+                self.inner[portal] = {p: distance[p] for p in portals if p != portal and p in distance}
+                self.inner_paths[portal] = path_from
+
+    def _add_crossing(self, source: int, target: int, cost: int):
+        for idx in (source, target):
+            if idx not in self.crossings:
+                self.crossings[idx] = {}
+                self.portals.setdefault(self.region[idx], []).append(idx)
+        self.crossings[source][target] = min(cost, self.crossings[source].get(target, math.inf))  # type: ignore
+
+    def _stretches(self, cells: List[int]) -> List[List[int]]:
+        """
+        Split border cells into groups of neighboring cells.
+        """
+        offsets = self.graph._offsets
+        indices = self.graph._indices
+        remaining = set(cells)
+        stretches = []
+        for cell in cells:
+            if cell not in remaining:
+                continue
+            remaining.remove(cell)
+            stretch = [cell]
+            stack = [cell]
+            while stack:
+                current = stack.pop()
+                for neighbor in indices[offsets[current]:offsets[current + 1]]:
+                    if neighbor in remaining:
+                        remaining.remove(neighbor)
+                        stretch.append(neighbor)
+                        stack.append(neighbor)
+            stretches.append(stretch)
+        return stretches
+
+    def _search_region(self, source: int, region: int, reverse=False) -> tuple[Dict[int, int], Dict[int, int]]:
+        """
+        Dijkstra from source over the cells of one region.
+        reverse: Distances from the cells to source, path_from then points towards source.
+        """
+        offsets = self.graph._offsets
+        indices = self.graph._indices
+        weights = self.graph._edge_costs[self.cost]
+        reverse_edges = self.graph._reverse_edges
+        in_region = self.region
+
+        distance = {source: 0}
+        path_from = {source: -1}
+        frontier = [(0, source)]
+        while frontier:
+            current_distance, current = heappop(frontier)
+            if current_distance > distance[current]:
+                continue
+            for k in range(offsets[current], offsets[current + 1]):
+                neighbor = indices[k]
+                if in_region[neighbor] != region:
+                    continue
+                new_distance = current_distance + weights[reverse_edges[k] if reverse else k]
+                if new_distance < distance.get(neighbor, math.inf):
+                    distance[neighbor] = new_distance
+                    path_from[neighbor] = current
+                    heappush(frontier, (new_distance, neighbor))
+        return distance, path_from
+
+    def is_long(self, source: int, target: int) -> bool:
+        """
+        Whether source and target are far enough apart for the region level to pay off.
+        """
+        dx = abs(self.graph._x[source] - self.graph._x[target])
+        dy = abs(self.graph._y[source] - self.graph._y[target])
+        return max(dx, dy) > 2 * self.region_size
+
+    def find_path(self, source: int, target: int) -> List[int]:
+        """
+        Cell ids on a path from source to target, empty if the portals don't connect them.
+        """
+        source_region = self.region[source]
+        target_region = self.region[target]
+        from_source, source_paths = self._search_region(source, source_region)
+        to_target, target_paths = self._search_region(target, target_region, reverse=True)
+
+        bounds = self.graph.landmarks[self.cost].towards(target) if self.cost in self.graph.landmarks else []
+
+        known_heuristics: Dict[int, float] = {}
+
+        def heuristic(node):
+            if node not in known_heuristics:
+                h = 0
+                for f, b, ft, bt in bounds:
+                    h = max(h, ft - f[node], b[node] - bt)
+                known_heuristics[node] = h
+            return known_heuristics[node]
+
+        # A* over the portals, starting at the portals of the source region
+        distance: Dict[int, float] = {}
+        parent: Dict[int, int] = {}
+        frontier = []
+        for portal in self.portals.get(source_region, []):
+            if portal in from_source:
+                distance[portal] = from_source[portal]
+                parent[portal] = -1
+                heappush(frontier, (distance[portal] + heuristic(portal), portal))
+
+        best = math.inf
+        last = -1
+        while frontier:
+            priority, current = heappop(frontier)
+            if priority >= best:
+                break
+            current_distance = distance[current]
+            if priority > current_distance + heuristic(current):
+                continue  # outdated entry
+            if current in to_target and current_distance + to_target[current] < best:
+                best = current_distance + to_target[current]
+                last = current
+            for edges in (self.inner.get(current, {}), self.crossings.get(current, {})):
+                for neighbor, cost in edges.items():
+                    new_distance = current_distance + cost
+                    if new_distance < distance.get(neighbor, math.inf):
+                        distance[neighbor] = new_distance
+                        parent[neighbor] = current
+                        heappush(frontier, (new_distance + heuristic(neighbor), neighbor))
+
+        if last == -1:
+            return []
+
+        # refine: walk the portals back and fill in the cells between them
+        portals = []
+        node = last
+        while node != -1:
+            portals.append(node)
+            node = parent[node]
+        portals.reverse()
+
+        path = self._unwind(source_paths, portals[0])
+        for current, next in zip(portals[:-1], portals[1:]):
+            if next in self.crossings[current] and self.region[next] != self.region[current]:
+                path.append(next)
+            else:
+                path.extend(self._unwind(self.inner_paths[current], next)[1:])
+        # path_from of the reverse search points towards the target
+        node = target_paths[portals[-1]]
+        while node != -1:
+            path.append(node)
+            node = target_paths[node]
+        return path
+
+    def _unwind(self, path_from: Dict[int, int], node: int) -> List[int]:
+        path = []
+        while node != -1:
+            path.append(node)
+            node = path_from[node]
+        return list(reversed(path))
@@ -0,0 +1,351 @@
+import math
+
+import numpy as np
+
+from .Delaunator import EPSILON, orient, circumcenter, pseudoAngle
+
+EDGE_STACK_SIZE = 512
+
+
+class ArrayDelaunator:
+    """
+    Array backed variant of Delaunator.
+
+    Produces the same triangulation as the pure python port, but keeps
+    coords (float64), triangles, halfedges and hull (int32) in numpy arrays.
+    Seed selection and the distance sort are vectorized (argsort instead of
+    the recursive quicksort), the sweep itself runs on plain lists with the
+    hot helpers inlined, as per-element numpy access would be slower there.
+    """
+
+    def __init__(self, points):
+        points = np.asarray(points, dtype=np.float64)
+
+        if (len(points) < 3):
+            raise ValueError("Need at least 3 points")
+
+        self.coords = points[:, :2].reshape(-1)
+        self.update(points[:, 0], points[:, 1])
+
+    def update(self, xs, ys):
+        # pick a seed point close to the center of the bbox
+        cx = (xs.min() + xs.max()) / 2
+        cy = (ys.min() + ys.max()) / 2
+        i0 = int(np.argmin(_dists(xs, ys, cx, cy)))
+        i0x = float(xs[i0])
+        i0y = float(ys[i0])
+
+        # find the point closest to the seed
+        d = _dists(xs, ys, i0x, i0y)
+        d[i0] = math.inf
+        d[d <= 0] = math.inf
+        i1 = int(np.argmin(d))
+        i1x = float(xs[i1])
+        i1y = float(ys[i1])
+
+        # find the third point which forms the smallest circumcircle with the first two
+        r = _circumradii(i0x, i0y, i1x, i1y, xs, ys)
+        r[[i0, i1]] = math.inf
+        i2 = int(np.argmin(r))
+        minRadius = r[i2]
+        i2x = float(xs[i2])
+        i2y = float(ys[i2])
+
+        if (minRadius == math.inf):
+            # order collinear points by dx (or dy if all x are identical)
+            # and return the list as a hull
+            dists = xs - xs[0]
+            dists = np.where(dists != 0, dists, ys - ys[0])
+            ids = np.argsort(dists, kind="stable")
+            _, first = np.unique(dists[ids], return_index=True)
+            self.hull = ids[first].astype(np.int32)
+            self.triangles = np.zeros(0, dtype=np.int32)
+            self.halfedges = np.zeros(0, dtype=np.int32)
+            return
+
+        # swap the order of the seed points for counter-clockwise orientation
+        if (orient(i0x, i0y, i1x, i1y, i2x, i2y)):
+            i1, i2 = i2, i1
+            i1x, i2x = i2x, i1x
+            i1y, i2y = i2y, i1y
+
+        cx, cy = circumcenter(i0x, i0y, i1x, i1y, i2x, i2y)
+
+        # sort the points by distance from the seed triangle circumcenter
+        ids = np.argsort(_dists(xs, ys, cx, cy), kind="stable").tolist()
+
+        triangles, halfedges, hull = _sweep(xs.tolist(), ys.tolist(), ids, i0, i1, i2, cx, cy)
+
+        self.hull = np.array(hull, dtype=np.int32)
+        self.triangles = np.array(triangles, dtype=np.int32)
+        self.halfedges = np.array(halfedges, dtype=np.int32)
+
+
+
+def _orient(x, y, rx, ry, qx, qy):
+    """
+    Same as Delaunator.orient, with the usually sufficient first check inlined.
+    """
+    l = (ry - y) * (qx - x)
+    r = (rx - x) * (qy - y)
+    if l != r and abs(l - r) >= 3.3306690738754716e-16 * abs(l + r):
+        return l - r < 0
+    return orient(x, y, rx, ry, qx, qy)
+
+
+def _sweep(xs, ys, ids, i0, i1, i2, cx, cy):
+    """
+    Add the points in order of their distance to the seed triangle,
+    maintaining the convex hull as we go. Returns triangles, halfedges and hull.
+    """
+    n = len(xs)
+    maxTriangles = max(2 * n - 5, 0)
+    triangles = [0] * maxTriangles * 3
+    halfedges = [-1] * maxTriangles * 3
+
+    hashSize = math.ceil(math.sqrt(n))
+    hullPrev = [0] * n
+    hullNext = [0] * n
+    hullTri = [0] * n
+    hullHash = [-1] * hashSize
+    edgeStack = [0] * EDGE_STACK_SIZE
+
+    def hashKey(x, y):
+        return math.floor(pseudoAngle(x - cx, y - cy) * hashSize) % hashSize
+
+    # set up the seed triangle as the starting hull
+    hullStart = i0
+    hullSize = 3
+
+    hullNext[i0] = hullPrev[i2] = i1
+    hullNext[i1] = hullPrev[i0] = i2
+    hullNext[i2] = hullPrev[i1] = i0
+
+    hullTri[i0] = 0
+    hullTri[i1] = 1
+    hullTri[i2] = 2
+
+    hullHash[hashKey(xs[i0], ys[i0])] = i0
+    hullHash[hashKey(xs[i1], ys[i1])] = i1
+    hullHash[hashKey(xs[i2], ys[i2])] = i2
+
+    triangles[0:3] = [i0, i1, i2]
+    trianglesLen = 3
+
+    xp = 0
+    yp = 0
+
+    for k, i in enumerate(ids):
+        x = xs[i]
+        y = ys[i]
+
+        # skip near-duplicate points
+        if (k > 0 and abs(x - xp) <= EPSILON and abs(y - yp) <= EPSILON): continue
+
+        xp = x
+        yp = y
+
+        # skip seed triangle points
+        if (i == i0 or i == i1 or i == i2): continue
+
+        # find a visible edge on the convex hull using edge hash
+        start = 0
+        key = hashKey(x, y)
+
+        for j in range(hashSize):
+            start = hullHash[(key + j) % hashSize]
+            if (start != -1 and start != hullNext[start]): break
+
+        start = hullPrev[start]
+        e = start
+
+        while True:
+            q = hullNext[e]
+            if _orient(x, y, xs[e], ys[e], xs[q], ys[q]): break
+            e = q
+
+            if (e == start):
+                e = -1
+                break
+
+        if (e == -1): continue  # likely a near-duplicate point; skip it
+
+        # add the first triangle from the point
+        t = trianglesLen
+        triangles[t:t + 3] = [e, i, hullNext[e]]
+        c = hullTri[e]
+        halfedges[t + 2] = c
+        if (c != -1):
+            halfedges[c] = t + 2
+        trianglesLen += 3
+
+        # recursively flip triangles from the point until they satisfy the Delaunay condition
+        hullTri[i] = _legalize(t + 2, triangles, halfedges, xs, ys, hullTri, hullPrev, hullStart, edgeStack)
+        hullTri[e] = t  # keep track of boundary triangles on the hull
+        hullSize += 1
+
+        # walk forward through the hull, adding more triangles and flipping recursively
+        n = hullNext[e]
+
+        while True:
+            q = hullNext[n]
+            if not _orient(x, y, xs[n], ys[n], xs[q], ys[q]): break
+            t = trianglesLen
+            triangles[t:t + 3] = [n, i, q]
+            a = hullTri[i]
+            halfedges[t] = a
+            if (a != -1):
+                halfedges[a] = t
+            c = hullTri[n]
+            halfedges[t + 2] = c
+            if (c != -1):
+                halfedges[c] = t + 2
+            trianglesLen += 3
+            hullTri[i] = _legalize(t + 2, triangles, halfedges, xs, ys, hullTri, hullPrev, hullStart, edgeStack)
+            hullNext[n] = n  # mark as removed
+            hullSize -= 1
+            n = q
+
+        # walk backward from the other side, adding more triangles and flipping
+        if (e == start):
+            while True:
+                q = hullPrev[e]
+                if not _orient(x, y, xs[q], ys[q], xs[e], ys[e]): break
+                t = trianglesLen
+                triangles[t:t + 3] = [q, i, e]
+                b = hullTri[e]
+                halfedges[t + 1] = b
+                if (b != -1):
+                    halfedges[b] = t + 1
+                c = hullTri[q]
+                halfedges[t + 2] = c
+                if (c != -1):
+                    halfedges[c] = t + 2
+                trianglesLen += 3
+                _legalize(t + 2, triangles, halfedges, xs, ys, hullTri, hullPrev, hullStart, edgeStack)
+                hullTri[q] = t
+                hullNext[e] = e  # mark as removed
+                hullSize -= 1
+                e = q
+
+        # update the hull indices
+        hullStart = hullPrev[i] = e
+        hullNext[e] = hullPrev[n] = i
+        hullNext[i] = n
+
+        # save the two new edges in the hash table
+        hullHash[hashKey(x, y)] = i
+        hullHash[hashKey(xs[e], ys[e])] = e
+
+    hull = [0] * hullSize
+    e = hullStart
+    for i in range(hullSize):
+        hull[i] = e
+        e = hullNext[e]
+
+    return triangles[:trianglesLen], halfedges[:trianglesLen], hull
+
+
+def _legalize(a, triangles, halfedges, xs, ys, hullTri, hullPrev, hullStart, edgeStack):
+    """
+    Flip triangles until they satisfy the Delaunay condition, see Delaunator._legalize.
+    Takes all state as arguments and has inCircle and _link inlined,
+    this is where the sweep spends most of its time.
+    """
+    i = 0
+    ar = 0
+
+    while True:
+        b = halfedges[a]
+        a0 = a - a % 3
+        ar = a0 + (a + 2) % 3
+
+        if (b == -1):  # convex hull edge
+            if (i == 0): break
+            i -= 1
+            a = edgeStack[i]
+            continue
+
+        b0 = b - b % 3
+        al = a0 + (a + 1) % 3
+        bl = b0 + (b + 2) % 3
+
+        p0 = triangles[ar]
+        pr = triangles[a]
+        pl = triangles[al]
+        p1 = triangles[bl]
+
+        # inCircle(p0, pr, pl, p1)
+        px = xs[p1]
+        py = ys[p1]
+        dx = xs[p0] - px
+        dy = ys[p0] - py
+        ex = xs[pr] - px
+        ey = ys[pr] - py
+        fx = xs[pl] - px
+        fy = ys[pl] - py
+
+        ap = dx * dx + dy * dy
+        bp = ex * ex + ey * ey
+        cp = fx * fx + fy * fy
+
+        if dx * (ey * cp - bp * fy) - dy * (ex * cp - bp * fx) + ap * (ex * fy - ey * fx) < 0:
+            triangles[a] = p1
+            triangles[b] = p0
+
+            hbl = halfedges[bl]
+
+            # edge swapped on the other side of the hull (rare); fix the halfedge reference
+            if (hbl == -1):
+                e = hullStart
+                while True:
+                    if (hullTri[e] == bl):
+                        hullTri[e] = a
+                        break
+                    e = hullPrev[e]
+                    if (e == hullStart): break
+
+            halfedges[a] = hbl
+            if (hbl != -1):
+                halfedges[hbl] = a
+            har = halfedges[ar]
+            halfedges[b] = har
+            if (har != -1):
+                halfedges[har] = b
+            halfedges[ar] = bl
+            halfedges[bl] = ar
+
+            # don't worry about hitting the cap: it can only happen on extremely degenerate input
+            if (i < EDGE_STACK_SIZE):
+                edgeStack[i] = b0 + (b + 1) % 3
+                i += 1
+        else:
+            if (i == 0): break
+            i -= 1
+            a = edgeStack[i]
+
+    return ar
+
+
+def _dists(xs, ys, x, y):
+    dx = xs - x
+    dy = ys - y
+    return dx * dx + dy * dy
+
+
+def _circumradii(ax, ay, bx, by, cxs, cys):
+    dx = bx - ax
+    dy = by - ay
+    ex = cxs - ax
+    ey = cys - ay
+
+    bl = dx * dx + dy * dy
+    cl = ex * ex + ey * ey
+    with np.errstate(divide="ignore", invalid="ignore"):
+        d = 0.5 / (dx * ey - dy * ex)
+        x = (ey * bl - dy * cl) * d
+        y = (dx * cl - ex * bl) * d
+        r = x * x + y * y
+
+    # degenerate (collinear) candidates never form the smallest circle
+    return np.where(np.isnan(r), math.inf, r)
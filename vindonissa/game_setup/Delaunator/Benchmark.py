@@ -0,0 +1,35 @@
+"""
+Compare the triangulation backends on jittered grids like the ones mapgen creates.
+
+Run from the repository root:
+python -m vindonissa.game_setup.Delaunator.Benchmark
+"""
+import random
+import time
+
+from vindonissa.game_setup.Delaunator.Delaunator import Delaunator
+from vindonissa.game_setup.Delaunator.ArrayDelaunator import ArrayDelaunator
+
+SIZES = [(120, 80), (200, 150), (400, 300)]
+JITTER = 0.5
+
+for width, height in SIZES:
+    random.seed(42)
+    points = [[x + (JITTER * (random.random() - random.random())),
+               y + (JITTER * (random.random() - random.random()))]
+              for x in range(width) for y in range(height)]
+
+    start_time = time.process_time()
+    python_result = Delaunator(points)
+    python_time = time.process_time() - start_time
+
+    start_time = time.process_time()
+    array_result = ArrayDelaunator(points)
+    array_time = time.process_time() - start_time
+
+    same = (array_result.triangles.tolist() == python_result.triangles and
+            array_result.halfedges.tolist() == python_result.halfedges and
+            array_result.hull.tolist() == python_result.hull)
+
+    print(f"{width}x{height} ({len(points)} points): python {python_time:.2f}s, array {array_time:.2f}s, "
+          f"speedup {python_time / array_time:.2f}x, identical: {same}")
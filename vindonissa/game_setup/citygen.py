@@ -1,58 +1,163 @@
 #!/usr/bin/env python3
 
-import math
-from typing import List
+from typing import Dict, Iterable, List
 from vindonissa.game_objects.cell import Cell
 from vindonissa.game_objects.city import WayNode, City, Port
 from vindonissa.game_objects.map import WorldMap
 from vindonissa.static_data.movement_costs import traderoute_cost
 
+from multiprocessing import Pool
+import math
 import random
 
-def connect_cities(map: WorldMap):
+import numpy as np
+
+from vindonissa.game_objects.graph import WorldGraph, SearchTree
+from vindonissa.util.spatial_index import SpatialIndex
+
+
+# weights of the city site score, each proto trade route passing a cell counts 1
+SITE_FERTILITY_WEIGHT = 2.0
+SITE_ORE_WEIGHT = 1.0
+SITE_RIVER_WEIGHT = 1.0
+SITE_COAST_WEIGHT = 1.0
+CITY_SPACING = 2  # no city center within this many steps of another, so territories (1 step) don't touch
+
+
+def search_connection(tree: SearchTree, cell_city: List[int], source_city: int, target: int, target_city: int) -> tuple[List[int], bool, int]:
+    """
+    Search the path for a connection between two cities (or their ports) on the cell graph,
+    continuing the search tree of the source.
+    Returns the cell ids on the path, whether the path stays out of other cities' territory and its cost.
+    """
+    path = tree.path_to(target)
+    if not path:
+        return path, False, 0
+    for current in path[:-1]:
+        # if any cell is not part of the source or target city,
+        # we cancel the connection
+        if cell_city[current] not in [source_city, target_city, -1]:
+            return path, False, 0
+    return path, True, tree.distance[target]
+
+
+def search_connections(tree: SearchTree, cell_city: List[int], source_city: int, targets: Iterable[tuple[int, int]]) -> List[tuple[List[int], bool, int]]:
+    """
+    Search connections to the targets (cell id, city id) in order,
+    until running out of tolerance for invalid ones like connect_cities does.
+    """
+    results = []
+    tolerance = 4
+    for target, target_city in targets:
+        result = search_connection(tree, cell_city, source_city, target, target_city)
+        results.append(result)
+        path, is_valid, _ = result
+        if path and not is_valid:
+            if tolerance == 0:
+                break
+            else:
+                tolerance -= 1
+    return results
+
+
+# state of the pool workers, set once per process
+_worker_graph: WorldGraph = None  # type: ignore
+_worker_cell_city: List[int] = []
+_worker_targets: Dict[str, SpatialIndex[tuple[int, int]]] = {}
+
+
+def _init_worker(graph: WorldGraph, cell_city: List[int], targets: Dict[str, SpatialIndex[tuple[int, int]]]):
+    global _worker_graph, _worker_cell_city, _worker_targets
+    _worker_graph = graph
+    _worker_cell_city = cell_city
+    _worker_targets = targets
+
+
+def _worker_search_connections(source: int, source_city: int, x: float, y: float, kind: str):
+    """
+    kind: "land" to search connections to the other cities, "sea" to the other ports.
+    """
+    targets = (t for t in _worker_targets[kind].nearest(x, y) if t[0] != source)
+    tree = _worker_graph.search_tree(source, traderoute_cost, only_land=kind == "land", only_water=kind == "sea")
+    return search_connections(tree, _worker_cell_city, source_city, targets)
+
+
+def connect_cities(map: WorldMap, processes: int|None = None):
     # improve sea connection finding
     # sea distance between cities should not include
     # embarkement cost!
     for city in map.cities:
         portcounter = 0
         harbors: List[List[Cell]] = []
+        in_harbor = set()
         for cell in city.terrain:
             if not cell.is_water or cell.is_deep_water:
                 continue
-            if cell in [c for h in harbors for c in h]:
+            if cell.id in in_harbor:
                 # already part of a harbor
                 continue
             inside: List[Cell] = []
             map.flood_fill(cell, inside, lambda x: x.is_water and not x.is_deep_water and x.city == cell.city)
             harbors.append(inside)
+            in_harbor.update([c.id for c in inside])
         
-        for harbor in harbors:
+        # one search from the city to all its harbors
+        port_distances = map.cell_to_cells_paths(city.cell, [harbor[0] for harbor in harbors], traderoute_cost)
+        for harbor, (distance, _) in zip(harbors, port_distances):
             cell = harbor[0]
             port = Port(portcounter, city, cell)
             city.ports.append(port)
-            path = map.cell_to_cell_path(city.cell, port.cell, traderoute_cost)
-            distance = 0
-            for current, next in zip(path[:-1], path[1:]):
-                distance += traderoute_cost(current, next)
-            city.port_connections.append(distance)
+            city.port_connections.append(distance if distance is not None else 0)
             portcounter += 1
 
+    assert map.graph is not None
+    # city id of every cell id, -1 outside of city territory
+    cell_city = [-1] * map.graph.size
+    for city in map.cities:
+        for cell in city.terrain:
+            cell_city[cell.id] = city.id
+
+    map.port_index = None  # ports were just created
+    city_index = map.get_city_index()
+    port_index = map.get_port_index()
+
+    # with processes, the searches of every source are done up front in a process pool
+    land_results = {}
+    sea_results = {}
+    if processes is not None and processes > 1:
+        # the workers get the same indices, over (cell id, city id) instead of the game objects
+        targets = {
+            "land": SpatialIndex([(c.cell.id, c.id) for c in city_index.items], city_index.positions),
+            "sea": SpatialIndex([(p.cell.id, p.city.id) for p in port_index.items], port_index.positions),
+        }
+        land_jobs = [(city.cell.id, city.id, city.cell.x, city.cell.y, "land") for city in map.cities]
+        sea_jobs = [(port.cell.id, port.city.id, port.cell.x, port.cell.y, "sea") for port in port_index.items]
+        with Pool(processes, initializer=_init_worker, initargs=(map.graph, cell_city, targets)) as pool:
+            land_results = dict(zip([city.id for city in map.cities], pool.starmap(_worker_search_connections, land_jobs)))
+            sea_results = dict(zip(port_index.items, pool.starmap(_worker_search_connections, sea_jobs)))
+
+    # the results are merged in the same order as they are computed without processes,
+    # so the outcome does not depend on the number of processes.
+    # Searches a worker skipped, because it ran out of tolerance earlier than
+    # the cached connections below allow, are done here.
+
     # we make calculation more efficient by keeping previously
     # calculated paths in memory
     distance_cache = {}
     land_path_cache = {}
 
-    # get a city network for land routes
+    # get a city network for land routes,
+    # the connections of a city continue one search from it
     for city in map.cities:
-        # sort other city by their closeness (luftlinie)
-        closest_cities = sorted(map.cities, key=lambda x: math.dist((city.cell.x, city.cell.y), (x.cell.x, x.cell.y)))
+        searched = land_results.get(city.id, [])
+        tree = None
         
         tolerance = 4
 
-        for c in closest_cities:
-            if c == city:
-                continue
+        # other cities by their closeness (luftlinie)
+        closest_cities = (c for c in city_index.nearest(city.cell.x, city.cell.y) if c != city)
 
+        for k, c in enumerate(closest_cities):
             distance = 0
             is_valid = True
             
@@ -60,16 +165,15 @@ def connect_cities(map: WorldMap):
                 distance = distance_cache[(c.id, city.id)]
                 path = land_path_cache[(c.id, city.id)]
             else:
-                path = map.cell_to_cell_path(city.cell, c.cell, traderoute_cost, only_land=True)
-                if not path:
+                if k < len(searched):
+                    path_ids, is_valid, distance = searched[k]
+                else:
+                    if tree is None:
+                        tree = map.graph.search_tree(city.cell.id, traderoute_cost, only_land=True)
+                    path_ids, is_valid, distance = search_connection(tree, cell_city, city.id, c.cell.id, c.id)
+                if not path_ids:
                     continue
-                for current, next in zip(path[:-1], path[1:]):
-                    distance += traderoute_cost(current, next)
-                    # if any cell is not part of the source or target city,
-                    # we cancel the connection
-                    if current.city not in [city, c, None]:
-                        is_valid = False
-                        break
+                path = [map.cells_by_id[idx] for idx in path_ids]
             
             if is_valid:
                 city.neighbors.append(c)
@@ -88,14 +192,14 @@ def connect_cities(map: WorldMap):
 
     for city in map.cities:
         for port in city.ports:
-            closest_ports = sorted([p for c in map.cities for p in c.ports], key=lambda x: math.dist((port.cell.x, port.cell.y), (x.cell.x, x.cell.y)))
+            searched = sea_results.get(port, [])
+            tree = None
             
             tolerance = 4
 
-            for p in closest_ports:
-                if port == p:
-                    continue
+            closest_ports = (p for p in port_index.nearest(port.cell.x, port.cell.y) if p != port)
 
+            for k, p in enumerate(closest_ports):
                 distance = 0
                 is_valid = True
                  
@@ -104,16 +208,15 @@ def connect_cities(map: WorldMap):
                     distance = distance_cache[((p.city.id, p.id), (city.id, port.id))]
                     path = sea_path_cache[((p.city.id, p.id), (city.id, port.id))]
                 else:
-                    path = map.cell_to_cell_path(port.cell, p.cell, traderoute_cost, only_water=True)
-                    if not path:
+                    if k < len(searched):
+                        path_ids, is_valid, distance = searched[k]
+                    else:
+                        if tree is None:
+                            tree = map.graph.search_tree(port.cell.id, traderoute_cost, only_water=True)
+                        path_ids, is_valid, distance = search_connection(tree, cell_city, port.city.id, p.cell.id, p.city.id)
+                    if not path_ids:
                         continue
-                    for current, next in zip(path[:-1], path[1:]):
-                        distance += traderoute_cost(current, next)
-                        # if any cell is not part of the source or target city,
-                        # we cancel the connection
-                        if current.city not in [port.city, p.city, None]:
-                            is_valid = False
-                            break
+                    path = [map.cells_by_id[idx] for idx in path_ids]
                 if is_valid:
                     port.port_connections.append((p, distance))
                     distance_cache[((city.id, port.id), (p.city.id, p.id))] = distance
@@ -125,10 +228,104 @@ def connect_cities(map: WorldMap):
                     else:
                         tolerance -= 1
 
+    map.invalidate_territories()  # the city network changed
+
     # calculate pathfinding cost to each city
 
 
-def generate(map: WorldMap):
+def count_proto_routes(map: WorldMap, border_cells: List[List[Cell]]) -> List[int]:
+    """
+    Proto trade routes from each side of the map to each other side.
+    A route ends at the closest of a sample of border cells of its target side,
+    so one search towards each side finds all routes to it.
+    Returns how many routes pass each cell id, coastal land cells also count
+    the routes passing on the water before them.
+    """
+    assert map.graph is not None
+    is_water = map.graph._is_water
+    offsets = map.graph._offsets
+    indices = map.graph._indices
+    route_counter = [0] * map.graph.size
+    rewarded = [-1] * map.graph.size  # last route a coastal cell profited from
+
+    targets = [random.sample(side, round(len(side) * 0.1)) for side in border_cells]
+    route = 0
+    for j, side_targets in enumerate(targets):
+        if not side_targets:
+            continue
+        distance, next_node = map.graph.towards_closest([c.id for c in side_targets], traderoute_cost)
+        for i, side in enumerate(border_cells):
+            if i == j:
+                continue
+            for source in random.sample(side, min(round(len(side) * 0.1), len(side_targets))):
+                if source.is_water or distance[source.id] == math.inf:
+                    continue
+                route += 1
+                node = source.id
+                while node != -1:
+                    route_counter[node] += 1
+                    if is_water[node]:
+                        # each coastal cell can only profit once from a route passing on the water before it
+                        for neighbor in indices[offsets[node]:offsets[node + 1]]:
+                            if not is_water[neighbor] and rewarded[neighbor] != route:
+                                rewarded[neighbor] = route
+                                route_counter[neighbor] += 1
+                    node = next_node[node]
+    return route_counter
+
+
+def site_scores(cells: List[Cell], route_counter: List[int]) -> np.ndarray:
+    """
+    How well suited each of the cells is for a city, by the proto trade routes
+    passing it, its fertility and ore, and whether it has a river or lies at the coast.
+    """
+    routes = np.array(route_counter, dtype=np.float64)[[c.id for c in cells]]
+    fertility = np.array([c.fertility for c in cells], dtype=np.float64)
+    ore = np.array([c.ore_density for c in cells], dtype=np.float64)
+    river = np.array([c.has_river for c in cells], dtype=np.float64)
+    coast = np.array([c.is_coastal for c in cells], dtype=np.float64)
+    return routes + SITE_FERTILITY_WEIGHT * fertility + SITE_ORE_WEIGHT * ore + SITE_RIVER_WEIGHT * river + SITE_COAST_WEIGHT * coast
+
+
+def select_city_sites(map: WorldMap, cells: List[Cell], scores: np.ndarray, spacing: int = CITY_SPACING) -> List[Cell]:
+    """
+    Greedy non-maximum suppression: take the best remaining cell as a city site
+    and rule out every cell within spacing steps of it, until no cell is left.
+    Cells with the same score keep their order.
+    """
+    assert map.graph is not None
+    offsets = map.graph._offsets
+    indices = map.graph._indices
+    blocked = bytearray(map.graph.size)
+    seen = [-1] * map.graph.size  # last site whose surroundings reached a cell
+
+    sites = []
+    for k in np.argsort(-scores, kind="stable").tolist():
+        cell = cells[k]
+        if blocked[cell.id]:
+            continue
+        site = len(sites)
+        sites.append(cell)
+        blocked[cell.id] = 1
+        seen[cell.id] = site
+        ring = [cell.id]
+        for _ in range(spacing):
+            next_ring = []
+            for idx in ring:
+                for neighbor in indices[offsets[idx]:offsets[idx + 1]]:
+                    if seen[neighbor] != site:
+                        seen[neighbor] = site
+                        blocked[neighbor] = 1
+                        next_ring.append(neighbor)
+            ring = next_ring
+    return sites
+
+
+def generate(map: WorldMap, processes: int|None = None, city_spacing: int = CITY_SPACING):
+    """
+    processes: Number of processes to search the city connections with.
+    city_spacing: Least number of steps between two cities minus one, higher gives fewer cities.
+    """
     # first phase: place cities randomly, except avoid water cells
     candidate_cells = map.land_cells.copy()
     random.shuffle(candidate_cells)
@@ -141,43 +338,23 @@ def generate(map: WorldMap):
         [c for c in map.cells if c.is_border_cell_south],
         [c for c in map.cells if c.is_border_cell_west],
         ]
-    for i, sideA in enumerate(border_cells):
-        for j, sideB in enumerate(border_cells):
-            if i == j:
-                continue
-            sources = random.sample(sideA, round(len(sideA) * 0.1))
-            targets = random.sample(sideB, round(len(sideB) * 0.1))
+    route_counter = count_proto_routes(map, border_cells)
+    for cell in map.cells:
+        cell.route_counter = route_counter[cell.id]
 
-            for source, target in zip(sources, targets):
-                if source.is_water:
-                    continue
-                path = map.cell_to_cell_path(source, target, cost=traderoute_cost)
-                rewarded_neighbors = []  # each coastal cell can only profit once from a route passing on the water before it
-                for p in path:
-                    p.route_counter += 1
-                    if p.is_water:
-                        for neighbor in [n for n in p.neighbors if not n.is_water and not n in rewarded_neighbors]:
-                            neighbor.route_counter += 1
-                            rewarded_neighbors.append(neighbor)
-
-    # third phase: replace the generation only by routes
-    # by a general attractiveness of this seed that should
-    # also take into account the fertility of the land, etc.
-
-    candidate_cells = sorted(candidate_cells, key=lambda x: x.route_counter, reverse=True)
+    # third phase: pick the city sites by a general attractiveness
+    # of the cells, which also takes into account the fertility of the land, etc.
+    candidate_cells = [cell for cell in candidate_cells if cell.elevation_category != 4]
+    sites = select_city_sites(map, candidate_cells, site_scores(candidate_cells, route_counter), spacing=city_spacing)
 
     map.cities = []
-    for cell in candidate_cells:
-        if cell.elevation_category == 4:
-            continue
-        if cell.city is not None or any([c.city is not None for c in cell.neighbors]):
-            continue
-        
+    for cell in sites:
         new_city = City(len(map.cities), cell)
 
         map.cities.append(new_city)
 
-    connect_cities(map)
+    map.invalidate_territories()
+    connect_cities(map, processes=processes)
 
     return map
 
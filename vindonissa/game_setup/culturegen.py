@@ -38,11 +38,7 @@ def create_culture_area(map: WorldMap):
         for city in map.cities:
             if city.culture is not None:
                 continue
-            if math.dist((seed.cell.x, seed.cell.y), (city.cell.x, city.cell.y)) > 20:
-                # this should make the program make many less calculations
-                # for the actual game, we could set this very high, as loading time there will be less relevant
-                continue
-            dist = map.city_to_city_dist(seed, city)
+            dist = map.city_distance(seed, city)
             if dist is None:
                 print(seed.id, city.id)
             else:
@@ -97,7 +93,9 @@ def assign_culture_groups(cultures: List[Culture], map: WorldMap):
         for cultureB in cultures:
             if cultureA == cultureB:
                 continue
-            distance = map.city_to_city_dist(cultureA.seed, cultureB.seed)
+            distance = map.city_distance(cultureA.seed, cultureB.seed)
+            if distance is None:
+                distance = math.inf  # unreachable cultures join a group last
             distances[(cultureA.id, cultureB.id)] = distance # type: ignore
 
     distances: List[tuple[tuple[int, int], int]] = sorted(distances.items(), key=lambda x: x[1]) # type: ignore
@@ -149,7 +147,12 @@ def set_initial_laws(map: WorldMap):
 
 
 
-def generate(map: WorldMap):
+def generate(map: WorldMap, distance_cache: str|None = None):
+    """
+    distance_cache: .npz file to keep the city distance matrix in,
+    so runs on the same map don't compute it again.
+    """
+    map.get_city_distances(cache_path=distance_cache)
     cultures = create_culture_area(map)
     assign_culture_traits(cultures)
     assign_culture_groups(cultures, map)
@@ -163,7 +166,7 @@ if __name__ == "__main__":
     sys.setrecursionlimit(100000)
     import pickle
     map = pickle.load(open("seed_42.pkl", mode="rb"))
-    generate(map)
+    generate(map, distance_cache="seed_42_distances.npz")
     pickle.dump(map, open("seed_42_cultures.pkl", mode="wb"))
     from vindonissa.game_setup.mapviz import draw_map
     draw_map(map)
\ No newline at end of file
@@ -1,7 +1,9 @@
 #!/usr/bin/env python3
 
+from heapq import heappush, heappop
 import math
-from typing import TYPE_CHECKING
+import random
+from typing import Dict, List
 import time
 
 from vindonissa.game_objects.map import WorldMap
@@ -9,6 +11,13 @@ from vindonissa.game_objects.city import City, Port, WayNode
 from vindonissa.static_data.movement_costs import traderoute_cost
 from vindonissa.static_data.gamemetrics import TRADE_VALUE_TO_CAPACITY_RATE
 
+ROUTE_BUDGET = 1000  # travel cost a trade route may take
+ROUTE_TOP_K = 5  # candidate trade routes kept per city
+ROUTE_MAX_EXPANSIONS = 2000  # partial routes extended per city at most
+ASSIGN_ROUTES_MAX_ITERATIONS = 10
+TRADEROUTE_BATCH_SIZE = 8  # trade routes searched at the same time with processes
+WEALTH_CHANGE_TOLERANCE = 0.05  # relative change of a city's wealth before the trade routes through it are searched again
+
 def initialize_cities(map: WorldMap):
     """
     Calculate initial pop assignments for all cities
@@ -19,55 +28,86 @@ def initialize_cities(map: WorldMap):
     end_time = time.time()
     print("initial setup:", end_time - start_time)
 
-def find_routes(current: WayNode, distance, paths, curr_path):
-    if curr_path:
-        prev_node = curr_path[-1]
-    else:
-        prev_node = None
-    
-    curr_path.append(current)  # Append the current node to the path
-    
-    assert current is not None
-    if type(current) == City:
-        neighbors = current.neighbors + current.ports
-        costs = list(current.land_connections.values()) + current.port_connections
-        assert len(neighbors) == len(costs)
-    elif type(current) == Port:
-        neighbors = [p for p, v in current.port_connections] + [current.city]
-        costs = [v for p, v in current.port_connections] + [80]  # TODO: get distance to city also as an information to the port
-        assert len(neighbors) == len(costs)
-    else:
-        raise ValueError
-
-    found_neighbor = False
-    for neighbor, cost in zip(neighbors, costs):
-        if cost > distance:
-            continue
-        if neighbor in curr_path:
-            continue
-        if prev_node is not None and type(prev_node) != Port and math.dist((curr_path[0].cell.x, curr_path[0].cell.y), (prev_node.cell.x, prev_node.cell.y)) > math.dist((curr_path[0].cell.x, curr_path[0].cell.y), (neighbor.cell.x, neighbor.cell.y)):
-            continue
-        find_routes(neighbor, distance - cost, paths, curr_path.copy())
-        found_neighbor = True
-    
-    if not found_neighbor:
-        paths.append([c for c in curr_path if type(c) == City])
+def route_network(map: WorldMap) -> Dict[WayNode, List[tuple[WayNode, int]]]:
+    """
+    Neighbors and travel costs of every city and port, as trade routes see them.
+    """
+    network = {}
+    for city in map.cities:
+        network[city] = list(zip(city.neighbors + city.ports, list(city.land_connections.values()) + city.port_connections))
+        for port in city.ports:
+            # TODO: get distance to city also as an information to the port
+            network[port] = [(p, v) for p, v in port.port_connections] + [(city, 80)]
+    return network
+
+def find_routes(start: City, wealth: Dict[City, float], network: Dict[WayNode, List[tuple[WayNode, int]]], budget: int = ROUTE_BUDGET, k: int = ROUTE_TOP_K, max_expansions: int = ROUTE_MAX_EXPANSIONS) -> List[List[City]]:
+    """
+    The k most valuable trade routes from start: paths over the city/port network within
+    the travel budget, without visiting a node twice and not turning back towards start.
+    A route is worth the wealth of its cities, the routes hold only the cities.
+    Best-first search that always extends the most valuable partial route, so good routes
+    are found first and the search can stop after max_expansions partial routes,
+    instead of enumerating every route.
+    """
+    start_x, start_y = start.cell.x, start.cell.y
+    start_distance: Dict[WayNode, float] = {}
+
+    def distance_to_start(node: WayNode) -> float:
+        if node not in start_distance:
+            start_distance[node] = math.dist((start_x, start_y), (node.cell.x, node.cell.y))
+        return start_distance[node]
+
+    counter = 0  # ties are extended in the order they were found
+    frontier = [(-wealth[start], counter, (start,), budget)]
+    routes: Dict[tuple[City, ...], float] = {}
+    expansions = 0
+    while frontier and expansions < max_expansions:
+        negative_value, _, path, remaining = heappop(frontier)
+        expansions += 1
+        current = path[-1]
+        prev_node = path[-2] if len(path) > 1 else None
+        # routes move away from start, except after leaving a port
+        min_distance = distance_to_start(prev_node) if prev_node is not None and type(prev_node) != Port else -1
+
+        found_neighbor = False
+        for neighbor, cost in network[current]:
+            if cost > remaining:
+                continue
+            if neighbor in path:
+                continue
+            if distance_to_start(neighbor) < min_distance:
+                continue
+            found_neighbor = True
+            value = -negative_value + (wealth[neighbor] if type(neighbor) == City else 0)
+            counter += 1
+            heappush(frontier, (-value, counter, path + (neighbor,), remaining - cost))
+
+        if not found_neighbor:
+            routes[tuple([c for c in path if type(c) == City])] = -negative_value
+
+    # partial routes left over when running out of expansions are routes too
+    for negative_value, _, path, _ in frontier:
+        routes.setdefault(tuple([c for c in path if type(c) == City]), -negative_value)
+
+    best = sorted(routes.items(), key=lambda item: item[1], reverse=True)[:k]
+    return [list(route) for route, _ in best]
 
 def create_traderoutes(map: WorldMap):
-    import sys
-    
+    wealth = {city: city.wealth for city in map.cities}
+    network = route_network(map)
     for city in map.cities:
-        routes = []
-        find_routes(city, 1000, routes, [])
-        city.potential_traderoutes = routes
+        city.potential_traderoutes = find_routes(city, wealth, network)
 
-def assign_best_routes(map: WorldMap):
+def assign_best_routes(map: WorldMap, incremental=False, processes: int|None = None, pool=None) -> bool:
     """
     For each city, make them choose their most valuable route. 
     Each other city on that route profits from that as well.
+    incremental: Only search the trade routes again that pass cities whose wealth moved, see create_traderoutes_new.
+    processes, pool: Search the trade routes in batches, in a process pool if more than one, see create_traderoutes_new.
+    Returns whether the trade routes stayed the same, so further iterations can be skipped.
     """
     start_time = time.time()
-    create_traderoutes_new(map)
+    searched, changed = create_traderoutes_new(map, incremental=incremental, processes=processes, pool=pool)
 
     for city in map.cities:
         city.capacities.set_new_capacity_maximum(city.capacities.trade, round(city.traderoute_wealth * TRADE_VALUE_TO_CAPACITY_RATE))
@@ -78,7 +118,8 @@ def assign_best_routes(map: WorldMap):
         #print("Total:", end_time - start_time)
 
     end_time = time.time()
-    print("one iter:", end_time-start_time)
+    print("one iter:", end_time-start_time, "routes searched:", searched, "changed:", changed)
+    return changed == 0
 
 def create_trade_endnodes(map: WorldMap):
     endpoints = []  # list of pairs
@@ -107,7 +148,20 @@ def create_trade_endnodes(map: WorldMap):
 
     map.trade_endpoints = endpoints
 
-def create_traderoutes_new(map: WorldMap):
+def moved_cities(map: WorldMap, wealth: List[float]) -> set[int]|None:
+    """
+    Ids of the cities whose wealth moved beyond the tolerance since the trade routes were searched,
+    None if every route has to be searched again.
+    """
+    basis = map.traderoute_wealth_basis
+    if len(basis) != len(wealth) or len(map.traderoutes) != len(map.trade_endpoints):
+        return None
+    # the average wealth scales the wealth modifier everywhere
+    if abs(sum(wealth) - sum(basis)) > WEALTH_CHANGE_TOLERANCE * sum(basis):
+        return None
+    return {i for i, (w, b) in enumerate(zip(wealth, basis)) if abs(w - b) > WEALTH_CHANGE_TOLERANCE * max(b, 1)}
+
+def create_traderoutes_new(map: WorldMap, incremental=False, processes: int|None = None, pool=None) -> tuple[int, int]:
     """
     New try: Similar to proto-traderoutes,
     we choose k starting points in the west and l starting points in the north.
@@ -116,63 +170,130 @@ def create_traderoutes_new(map: WorldMap):
     The route chooses a path dictated by shortest distance and max wealth on the route.
     To get a bit more varience we might reduce value of cities according to how
     many routes already flow through.
+    incremental: Keep the routes of the last call that don't pass a city whose wealth moved
+    beyond WEALTH_CHANGE_TOLERANCE, or a city on a route that changed before in this call.
+    processes: Search the routes in batches of TRADEROUTE_BATCH_SIZE on the city graph,
+    in a process pool if more than one. The routes of a batch are searched with the route counters
+    of the batches before, a route that passes a city counted by an earlier route of its batch
+    (or that is no longer kept because of one) is searched again. The results don't depend on the number of processes.
+    pool: From CityGraph.path_pool, to reuse one pool over several calls. Otherwise one is opened for this call.
+    Returns the number of routes searched and how many of them changed.
     """
     # reset citys traderoute infos
     for city in map.cities:
         city.traderoute_counter = 0
         city.traderoute_wealth = 0
 
+    wealth = [city.wealth_no_trade for city in map.cities]
+    moved = moved_cities(map, wealth) if incremental else None
+    previous_routes = map.traderoutes if len(map.traderoutes) == len(map.trade_endpoints) else []
+    if moved is None:
+        map.traderoute_wealth_basis = wealth
+    else:
+        for i in moved:
+            map.traderoute_wealth_basis[i] = wealth[i]
+
+    def is_kept(i: int) -> bool:
+        return moved is not None and not any([(c.id if type(c) == City else c.city.id) in moved for c in previous_routes[i]])
+
+    batch_size = TRADEROUTE_BATCH_SIZE if processes is not None else 1
+    own_pool = pool is None and processes is not None and processes > 1
+    if own_pool:
+        pool = map.get_city_graph().path_pool(processes)
+
     routes = []
-    for first, last in map.trade_endpoints:
-        route = map.city_to_city_path(first, last, apply_wealth_modifier=True)  # type: ignore
-        routes.append(route)
-        for k, city in enumerate(route):
-            l = k
-            total_trade_wealth = 0
-            # iterate previous cities
-            iterations = 0
-            while iterations < 3:
-                if l < 0:
-                    break
-                prev_city = route[l]
-                if type(prev_city) == Port:
-                    if prev_city.city not in route:
-                        total_trade_wealth += prev_city.city.wealth_no_trade
-                    else:
-                        iterations -= 1
-                elif type(prev_city) == City:
-                    total_trade_wealth += prev_city.wealth_no_trade
-                l -= 1
-                iterations += 1
-            # iterate following cities
-            l = k
-            iterations = 0
-            while iterations < 3:
-                if l >= len(route):
-                    break
-                next_city = route[l]
-                if type(next_city) == Port:
-                    if next_city.city not in route:
-                        total_trade_wealth += next_city.city.wealth_no_trade
-                    else:
-                        l += 1
-                elif type(next_city) == City:
-                    total_trade_wealth += next_city.wealth_no_trade
-                l += 1
-                iterations += 1
-
-            if type(city) == Port:
-                if city.city not in route:
-                    city.city.traderoute_counter += 1
-                    city.city.traderoute_wealth += total_trade_wealth
-            elif type(city) == City:
-                city.traderoute_counter += 1
-                city.traderoute_wealth += total_trade_wealth
+    searched = 0
+    changed = 0
+    try:
+        for batch_start in range(0, len(map.trade_endpoints), batch_size):
+            batch = range(batch_start, min(batch_start + batch_size, len(map.trade_endpoints)))
+            todo = [i for i in batch if not is_kept(i)]
+            if processes is not None:
+                traderoute_counters = [city.traderoute_counter for city in map.cities]
+                paths = map.wealth_modified_paths([map.trade_endpoints[i] for i in todo], wealth, traderoute_counters, pool=pool)
+            else:
+                paths = [map.city_to_city_path(first, last, apply_wealth_modifier=True, wealth=wealth) for first, last in [map.trade_endpoints[i] for i in todo]]  # type: ignore
+            searched_routes = dict(zip(todo, paths))
+
+            # the routes are added up in order, no matter where they were searched
+            touched: set[int] = set()  # cities whose route counter went up since the batch was searched
+            for i in batch:
+                if i in searched_routes or not is_kept(i):
+                    route = searched_routes.get(i, [])
+                    if i not in searched_routes or any([(c.id if type(c) == City else c.city.id) in touched for c in route]):
+                        # more routes only make cities more expensive, the route is still the best one
+                        # if none of its cities got one, otherwise it is searched again like in serial
+                        traderoute_counters = [city.traderoute_counter for city in map.cities]
+                        route = map.wealth_modified_paths([map.trade_endpoints[i]], wealth, traderoute_counters)[0]
+                    searched += 1
+                    if not previous_routes or route != previous_routes[i]:
+                        changed += 1
+                        if moved is not None:
+                            # the route counters of the cities on both routes change for the routes after it
+                            moved.update([c.id if type(c) == City else c.city.id for c in route + previous_routes[i]])
+                else:
+                    route = previous_routes[i]
+                routes.append(route)
+                add_traderoute(route)
+                touched.update([c.id if type(c) == City else c.city.id for c in route])
+    finally:
+        if own_pool:
+            pool.close()
+            pool.join()
     map.traderoutes = routes
+    return searched, changed
+
+def add_traderoute(route: List[WayNode]):
+    """
+    Count the route for the cities on it, each gets the wealth of its closest neighbors on the route.
+    """
+    for k, city in enumerate(route):
+        l = k
+        total_trade_wealth = 0
+        # iterate previous cities
+        iterations = 0
+        while iterations < 3:
+            if l < 0:
+                break
+            prev_city = route[l]
+            if type(prev_city) == Port:
+                if prev_city.city not in route:
+                    total_trade_wealth += prev_city.city.wealth_no_trade
+                else:
+                    iterations -= 1
+            elif type(prev_city) == City:
+                total_trade_wealth += prev_city.wealth_no_trade
+            l -= 1
+            iterations += 1
+        # iterate following cities
+        l = k
+        iterations = 0
+        while iterations < 3:
+            if l >= len(route):
+                break
+            next_city = route[l]
+            if type(next_city) == Port:
+                if next_city.city not in route:
+                    total_trade_wealth += next_city.city.wealth_no_trade
+                else:
+                    l += 1
+            elif type(next_city) == City:
+                total_trade_wealth += next_city.wealth_no_trade
+            l += 1
+            iterations += 1
+
+        if type(city) == Port:
+            if city.city not in route:
+                city.city.traderoute_counter += 1
+                city.city.traderoute_wealth += total_trade_wealth
+        elif type(city) == City:
+            city.traderoute_counter += 1
+            city.traderoute_wealth += total_trade_wealth
 
-def setup(map: WorldMap):
+def setup(map: WorldMap, processes: int|None = None):
     """
     Perform the final setup steps where a lot of the game objects interact.
+    processes: Number of processes to search the trade routes with.
     """
     print("SETUP!")
 
@@ -183,12 +304,19 @@ def setup(map: WorldMap):
     #end_time = time.time()
     #execution_time = end_time - start_time
     #print(execution_time)
-    for _ in range(10):
-        assign_best_routes(map)
+    # one pool for all iterations, the city graph doesn't change in between
+    pool = map.get_city_graph().path_pool(processes) if processes is not None and processes > 1 else None
+    try:
+        for _ in range(ASSIGN_ROUTES_MAX_ITERATIONS):
+            if assign_best_routes(map, incremental=True, processes=processes, pool=pool):
+                break  # the trade routes settled
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
 
 
 if __name__ == "__main__":
-    import random
     random.seed(42)
     import pickle
     import sys
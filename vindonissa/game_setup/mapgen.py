@@ -1,199 +1,171 @@
 #!/usr/bin/env python3
 
-from collections import defaultdict
 import math
 from typing import List, Dict
-from opensimplex import OpenSimplex
+import numpy as np
 from random import random, randint, sample, choice, seed
 
 from vindonissa.game_objects.cell import Cell
 from vindonissa.game_objects.map import WorldMap
 from vindonissa.game_objects.river import River
-from vindonissa.game_setup.Delaunator import Delaunator
+from vindonissa.util.noise import NoiseField
+from vindonissa.game_setup.Delaunator import Delaunator, ArrayDelaunator
 from vindonissa.game_setup.mapviz import draw_map
 
 
+# triangulation backends, both expose coords, triangles, halfedges and hull
+DELAUNAY_BACKENDS = {
+    "python": Delaunator.Delaunator,
+    "array": ArrayDelaunator.ArrayDelaunator,
+}
+
+
 def calculateCentroids(points, delaunay):
-    numTriangles = len(delaunay.halfedges) / 3
-    centroids = []
-    for t in range(int(numTriangles)):
-        sumOfX = 0
-        sumOfY = 0
-        for i in range(3):
-            s = 3*t + i
-            p = points[delaunay.triangles[s]]
-            sumOfX += p[0]
-            sumOfY += p[1]
-        centroids.append({"x": sumOfX / 3, "y": sumOfY / 3})
-    return centroids
+    corners = np.asarray(points, dtype=np.float64)[np.asarray(delaunay.triangles).reshape(-1, 3)]
+    sums = corners[:, 0] + corners[:, 1] + corners[:, 2]
+    return [{"x": x, "y": y} for x, y in (sums / 3).tolist()]
+
+
+def normalized_coordinates(points, numRegions, width, height):
+    """
+    Shift the point coordinates into a -0.5 to 0.5 range for noise sampling.
+    """
+    coords = np.asarray(points[:numRegions], dtype=np.float64)
+    return coords[:, 0] / width - 0.5, coords[:, 1] / height - 0.5
 
 
 def assignForests(points, numregions, width, height, wavelength, elevation, thresholds):
-    noise = OpenSimplex(seed=randint(0, 9999999))
-    noise2 = OpenSimplex(seed=randint(0, 9999999))
-    noise3 = OpenSimplex(seed=randint(0, 9999999))
+    noise = NoiseField([randint(0, 9999999), randint(0, 9999999), randint(0, 9999999)])
 
-    elevation_average = sum([e for e in elevation if e > thresholds[0]]) / len([e for e in elevation if e > thresholds[0]])
+    elevation = np.asarray(elevation)
+    land_elevation = elevation[elevation > thresholds[0]]
+    elevation_average = sum(land_elevation.tolist()) / len(land_elevation)
 
     freq1 = 3
     freq2 = freq1 * 4
     freq3 = freq2 * 4
 
-    treelevel = []
-    for r in range(numregions):
-        nx = points[r][0] / width - 0.5
-        ny = points[r][1] / height - 0.5
-        sample = ((1 * noise.noise2d(freq1 * nx / wavelength, freq1 * ny / wavelength) + 
-                    0.5 * noise2.noise2d(freq2 * nx / wavelength, freq2 * ny / wavelength) +
-                    0.25 * noise3.noise2d(freq3 * nx / wavelength, freq3 * ny / wavelength)) / 1.75)
-        
-        sample = abs(sample)
-
-        sample += elevation_average * 0.3
-        
-        # modify by elevation and waterlevel
-        if elevation[r] <= thresholds[0]:
-            sample = 0  # no trees in water
-        else:
-            sample = sample - (elevation[r] * 0.3)
-        
-        treelevel.append(sample)
-    
+    nx, ny = normalized_coordinates(points, numregions, width, height)
+    octaves = noise.octaves(nx, ny, [freq1, freq2, freq3], wavelength)
+    sample = (1 * octaves[0] + 0.5 * octaves[1] + 0.25 * octaves[2]) / 1.75
+
+    sample = np.abs(sample)
+
+    sample += elevation_average * 0.3
+
+    # modify by elevation and waterlevel, no trees in water
+    treelevel = np.where(elevation <= thresholds[0], 0, sample - (elevation * 0.3))
+
     return treelevel
 
 def assignFertility(points, numregions, width, height, wavelength, elevation, thresholds):
-    noise = OpenSimplex(seed=randint(0, 9999999))
-    noise2 = OpenSimplex(seed=randint(0, 9999999))
-    noise3 = OpenSimplex(seed=randint(0, 9999999))
+    noise = NoiseField([randint(0, 9999999), randint(0, 9999999), randint(0, 9999999)])
 
-    elevation_average = sum([e for e in elevation if e > thresholds[0]]) / len([e for e in elevation if e > thresholds[0]])
+    elevation = np.asarray(elevation)
+    land_elevation = elevation[elevation > thresholds[0]]
+    elevation_average = sum(land_elevation.tolist()) / len(land_elevation)
 
     freq1 = 2
     freq2 = freq1 * 2
     freq3 = freq2 * 2
 
-    fertilelevel = []
-    for r in range(numregions):
-        nx = points[r][0] / width - 0.5
-        ny = points[r][1] / height - 0.5
-        sample = ((1 * noise.noise2d(freq1 * nx / wavelength, freq1 * ny / wavelength) + 
-                    1 * noise2.noise2d(freq2 * nx / wavelength, freq2 * ny / wavelength) +
-                    1 * noise3.noise2d(freq3 * nx / wavelength, freq3 * ny / wavelength)) / 3)
-        
-        # shape from -1 to 1 to 0 to 1
-        sample += 1
-        sample /= 2
-
-        sample += elevation_average * 0.5
-        
-        # modify by elevation and waterlevel
-        sample = sample - (elevation[r] * 0.5)
-        
-        fertilelevel.append(sample)
-    
+    nx, ny = normalized_coordinates(points, numregions, width, height)
+    octaves = noise.octaves(nx, ny, [freq1, freq2, freq3], wavelength)
+    sample = (1 * octaves[0] + 1 * octaves[1] + 1 * octaves[2]) / 3
+
+    # shape from -1 to 1 to 0 to 1
+    sample += 1
+    sample /= 2
+
+    sample += elevation_average * 0.5
+
+    # modify by elevation and waterlevel
+    fertilelevel = sample - (elevation * 0.5)
+
     return fertilelevel
 
 def assignOreDensity(points, numregions, width, height, wavelength, elevation, thresholds):
-    noise = OpenSimplex(seed=randint(0, 9999999))
-    noise2 = OpenSimplex(seed=randint(0, 9999999))
-    noise3 = OpenSimplex(seed=randint(0, 9999999))
+    noise = NoiseField([randint(0, 9999999), randint(0, 9999999), randint(0, 9999999)])
 
-    elevation_average = sum([e for e in elevation if e > thresholds[0]]) / len([e for e in elevation if e > thresholds[0]])
+    elevation = np.asarray(elevation)
+    land_elevation = elevation[elevation > thresholds[0]]
+    elevation_average = sum(land_elevation.tolist()) / len(land_elevation)
 
     freq1 = 2
     freq2 = freq1 * 2
     freq3 = freq2 * 8
 
-    orelevel = []
-    for r in range(numregions):
-        nx = points[r][0] / width - 0.5
-        ny = points[r][1] / height - 0.5
-
-        sample1 = noise.noise2d(freq1 * nx / wavelength, freq1 * ny / wavelength)
-        sample2 = noise2.noise2d(freq2 * nx / wavelength, freq2 * ny / wavelength)
-        sample3 = 0.9 if noise3.noise2d(freq3 * nx / wavelength, freq3 * ny / wavelength) > 0.6 else -0.9
-        sample = (sample1 + sample2 + sample3) / 3
-        #sample = (sample1 + sample2) / 2
-        #sample = sample3
-        
-        # shape from -1 to 1 to 0 to 1
-        sample += 1
-        sample /= 2
-
-        sample -= elevation_average
-        
-        # modify by elevation and waterlevel
-        sample = sample + (elevation[r])
-
-        #sample = 0.9 if sample > 0.8 else 0.1
-        
-        orelevel.append(sample)
-    
+    nx, ny = normalized_coordinates(points, numregions, width, height)
+    octaves = noise.octaves(nx, ny, [freq1, freq2, freq3], wavelength)
+    sample1 = octaves[0]
+    sample2 = octaves[1]
+    sample3 = np.where(octaves[2] > 0.6, 0.9, -0.9)
+    sample = (sample1 + sample2 + sample3) / 3
+
+    # shape from -1 to 1 to 0 to 1
+    sample += 1
+    sample /= 2
+
+    sample -= elevation_average
+
+    # modify by elevation and waterlevel
+    orelevel = sample + elevation
+
     return orelevel
 
 def assignElevation(points, numRegions, width, height, wavelength):
-    noise = OpenSimplex(seed=randint(0, 9999999))
-    noise2 = OpenSimplex(seed=randint(0, 9999999))
-    noise3 = OpenSimplex(seed=randint(0, 9999999))
+    noise = NoiseField([randint(0, 9999999), randint(0, 9999999), randint(0, 9999999)])
 
     freq1 = 6
     freq2 = freq1 * 2
     freq3 = freq2 * 2
 
-    elevation = []
-    for r in range(numRegions):
-        nx = points[r][0] / width - 0.5
-        ny = points[r][1] / height - 0.5
-        factors = [1, 1, 0.5]
-        sample = ((factors[0] * noise.noise2d(freq1 * nx / wavelength, freq1 * ny / wavelength) + 
-                    factors[1] * noise2.noise2d(freq2 * nx / wavelength, freq2 * ny / wavelength) +
-                    factors[2] * noise3.noise2d(freq3 * nx / wavelength, freq3 * ny / wavelength)) / sum(factors))
-        
-        # shape from -1 to 1 to 0 to 1
-        sample += 1
-        sample /= 2
-        
-        
-        # shaping the landmass
-        tx = max(0.6, points[r][0] / width)
-        ty = max(0.6, points[r][1] / height)
-        d = min(1, (tx * tx + ty * ty) / math.sqrt(2))
-        sample = (1 + sample - d) / 2
-
-        
-        # valley factor
-        sample = pow(sample, 2).real
-
-        """
-        # shaping the landmass (weaker shaping)
-        tx = max(0.3, points[r][0] / width)
-        ty = max(0.3, points[r][1] / height)
-        d = min(1, (tx * tx + ty * ty) / math.sqrt(2))
-        sample = (0.5 + sample - d*0.5) / 2
-        """
-        
-        elevation.append(sample)
+    nx, ny = normalized_coordinates(points, numRegions, width, height)
+    factors = [1, 1, 0.5]
+    octaves = noise.octaves(nx, ny, [freq1, freq2, freq3], wavelength)
+    sample = (factors[0] * octaves[0] + 
+                factors[1] * octaves[1] +
+                factors[2] * octaves[2]) / sum(factors)
+
+    # shape from -1 to 1 to 0 to 1
+    sample += 1
+    sample /= 2
+
+    # shaping the landmass
+    coords = np.asarray(points[:numRegions], dtype=np.float64)
+    tx = np.maximum(0.6, coords[:, 0] / width)
+    ty = np.maximum(0.6, coords[:, 1] / height)
+    d = np.minimum(1, (tx * tx + ty * ty) / math.sqrt(2))
+    sample = (1 + sample - d) / 2
+
+    # valley factor
+    elevation = np.power(sample, 2)
+
+    """
+    # shaping the landmass (weaker shaping)
+    tx = np.maximum(0.3, coords[:, 0] / width)
+    ty = np.maximum(0.3, coords[:, 1] / height)
+    d = np.minimum(1, (tx * tx + ty * ty) / math.sqrt(2))
+    sample = (0.5 + sample - d*0.5) / 2
+    """
 
     return elevation
 
 
 def assignMoisture(points, numRegions, width, height, wavelength):
-    noise = OpenSimplex(seed=randint(0, 99999))
-    moisture = []
-    for r in range(numRegions):
-        nx = points[r][0] / width - 0.5
-        ny = points[r][1] / height - 0.5
-        moisture.append((1 + noise.noise2d(nx / wavelength, ny / wavelength)) / 2)
+    noise = NoiseField([randint(0, 99999)])
+    nx, ny = normalized_coordinates(points, numRegions, width, height)
+    moisture = (1 + noise.octaves(nx, ny, [1], wavelength)[0]) / 2
     return moisture
 
 
-def get_elevation_thresholds(elevation: List[float]) -> List[float]:
+def get_elevation_thresholds(elevation: np.ndarray) -> List[float]:
     """
     Let's us set categories for our elevation
     """
-    sorted_elevation = sorted(elevation)
+    sorted_elevation = np.sort(elevation)
     thresholds = [0.3, 0.6, 0.9, 0.98, 1]
-    return [sorted_elevation[int(len(sorted_elevation) * t)-1] for t in thresholds]
+    return [float(sorted_elevation[int(len(sorted_elevation) * t)-1]) for t in thresholds]
 
 
 def nextHalfedge(e):
@@ -238,41 +210,44 @@ def create_cell_coordinates(numEdges, triangles, delaunay, centers):
     return coords
 
 
-def get_cell_neighbors(cells_by_id: Dict[int, Cell], numEdges, triangles, delaunay, centers):
+def get_cell_neighbors(cells_by_id: Dict[int, Cell], triangles, halfedges, num_points: int) -> tuple[np.ndarray, np.ndarray]:
     """
-    A pretty clunky piece of code that looks up which cells share vertices so we know that
-    they are neighbored. By no means perfect, but it does the job at least.
+    Each pair of halfedges is an edge of the delaunay triangulation shared by two triangles,
+    so the two points it connects are neighboring cells. Hull edges (no opposite halfedge)
+    only touch a single cell corner and are not counted, neither are pairs of border cells.
+
+    Fills Cell.neighbors and returns the adjacency as CSR arrays (offsets, indices) over cell ids:
+    the neighbors of cell i are indices[offsets[i]:offsets[i+1]].
     """
-    vertex_to_points = defaultdict(list)
-    
-    seen = set()
-    for e in range(numEdges):
-        r = triangles[nextHalfedge(e)]
-        if r not in seen:
-            seen.add(r)
-            vertices = edgesArountPoint(delaunay, e)
-            if len(vertices) < 3:
-                continue
-            vertices = [(centers[triangleOfEdge(x)]["x"], centers[triangleOfEdge(x)]["y"]) for x in vertices]
-            # point_to_vertices[r] = set(vertices)
-            for vertex in vertices:
-                vertex_to_points[vertex].append(r)
-
-    for vertex, points in vertex_to_points.items():
-        current_cells: List[Cell] = []
-        for point in points:
-            cell = cells_by_id[point]
-            cell.vertices.add(vertex)
-            current_cells.append(cell)
-        for i, a in enumerate(current_cells):
-            for b in current_cells[i+1:]:
-                if a in b.neighbors:
-                    continue
-                if a.is_border_cell and b.is_border_cell:
-                    continue
-                if len(a.vertices.intersection(b.vertices)) > 1:
-                    a.neighbors.append(b)
-                    b.neighbors.append(a)
+    triangles = np.asarray(triangles, dtype=np.int64)
+    halfedges = np.asarray(halfedges, dtype=np.int64)
+
+    edges = np.arange(len(halfedges))
+    next_edges = np.where(edges % 3 == 2, edges - 2, edges + 1)
+    paired = halfedges > edges  # visit every shared edge once
+    a = triangles[edges[paired]]
+    b = triangles[next_edges[paired]]
+
+    exists = np.zeros(num_points, dtype=bool)
+    exists[list(cells_by_id.keys())] = True
+    is_border = np.zeros(num_points, dtype=bool)
+    is_border[[cell.id for cell in cells_by_id.values() if cell.is_border_cell]] = True
+    keep = exists[a] & exists[b] & ~(is_border[a] & is_border[b])
+
+    sources = np.concatenate([a[keep], b[keep]])
+    targets = np.concatenate([b[keep], a[keep]])
+    order = np.lexsort((targets, sources))
+
+    offsets = np.zeros(num_points + 1, dtype=np.int32)
+    np.cumsum(np.bincount(sources, minlength=num_points), out=offsets[1:])
+    indices = targets[order].astype(np.int32)
+
+    offsets_list = offsets.tolist()
+    indices_list = indices.tolist()
+    for idx, cell in cells_by_id.items():
+        cell.neighbors = [cells_by_id[n] for n in indices_list[offsets_list[idx]:offsets_list[idx + 1]]]
+
+    return offsets, indices
 
 
 def create_river(origin: Cell, 
@@ -404,6 +379,9 @@ def create_rivers(map: WorldMap, river_perc: float) -> List[River]:
         river_budget -= len(new_river)
         rivers.append(new_river)
 
+    # rivers make travel along them cheaper
+    map.invalidate_cells([c for r in rivers for c in r.path])
+
     return rivers
 
 
@@ -414,9 +392,11 @@ def create_worldmap(
         wavelength: float = 1, 
         wavelength_moisture: float = 1,
         draw_map_: bool = False,
-        river_perc: float = 0.2) -> WorldMap:
+        river_perc: float = 0.2,
+        delaunay_backend: str = "array") -> WorldMap:
     """
     Create a new map, including elevation, moisture, etc.
+    delaunay_backend: Key into DELAUNAY_BACKENDS, "array" is the faster one.
     """
     map: WorldMap = WorldMap(width, height)
 
@@ -428,7 +408,7 @@ def create_worldmap(
                 y + (jitter * (random() - random()))]
             )
 
-    delaunay = Delaunator.Delaunator(points)
+    delaunay = DELAUNAY_BACKENDS[delaunay_backend](points)
     centers = calculateCentroids(points, delaunay)
     elevation = assignElevation(points, len(points), width, height, wavelength)
     moisture = assignMoisture(points, len(points), width, height, wavelength_moisture)
@@ -443,7 +423,7 @@ def create_worldmap(
     #print(len(coords), len(points), len(elevation))
 
     # Make each point a Cell object
-    for (x, y), e, tree, fert, ore, i in zip(points, elevation, treelevel, fertility, ore_density, range(len(points))):
+    for (x, y), e, tree, fert, ore, i in zip(points, elevation.tolist(), treelevel.tolist(), fertility.tolist(), ore_density.tolist(), range(len(points))):
         if i not in coords:
             continue
         for tr, t in enumerate(thresholds):
@@ -454,12 +434,15 @@ def create_worldmap(
 
     # assign neighbors
     map.setup_cells()
-    get_cell_neighbors(map.cells_by_id, len(delaunay.halfedges), delaunay.triangles, delaunay, centers)
+    map.neighbor_offsets, map.neighbor_indices = get_cell_neighbors(map.cells_by_id, delaunay.triangles, delaunay.halfedges, len(points))
     map.setup_cells2()
 
     # create rivers
     map.rivers = create_rivers(map, river_perc)
 
+    # pathfinding graph, edge costs depend on the rivers
+    map.setup_graph()
+
     if draw_map_:
         draw_map(map)
 
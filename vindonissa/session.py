@@ -12,6 +12,8 @@ from vindonissa.util.calendar import Calendar
 from game_objects.map import WorldMap
 from vindonissa.game_setup import mapgen, citygen, culturegen, popgen, chargen, final_setup
 
+CITY_DISTANCE_CACHE = "mapfiles/city_distances.npz"  # distances between the cities of the last generated map
+
 class Session(Scene):
     """
     The Session object holds all information about a game session.
@@ -35,7 +37,7 @@ class Session(Scene):
         self.main.write_left_text("Finished terrain generation!")
         citygen.generate(self.map)
         self.main.write_left_text("Finished city generation!")
-        culturegen.generate(self.map)
+        culturegen.generate(self.map, distance_cache=CITY_DISTANCE_CACHE)
         self.main.write_left_text("Finished culture generation!")
         popgen.generate(self.map)
         self.main.write_left_text("Finished population generation!")
@@ -12,7 +12,7 @@ def traderoute_cost(source: Cell, target: Cell):
     if (source.is_water and not target.is_water) or (not source.is_water and target.is_water):
         return 80
 
-    if target in [c for r, c, m in source.river_connections if m == "out"]:
+    if any(c == target and m == "out" for r, c, m in source.river_connections):
         return 50
     
     # but moving along coasts is fast
@@ -40,4 +40,9 @@ def traderoute_cost(source: Cell, target: Cell):
     # tree level (-5 to +5 pts for no forests to forests)
     cost += round((target.trees * 10) - 5)
 
-    return cost
\ No newline at end of file
+    return cost
+
+
+# cost functions that only depend on the terrain of the two cells,
+# the map precomputes them for every edge once the rivers are placed
+PRECOMPUTED_COSTS = [traderoute_cost]
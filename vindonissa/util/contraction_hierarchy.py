@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+
+from heapq import heappush, heappop, heapify
+import math
+from typing import Dict, List
+
+
+WITNESS_SETTLE_LIMIT = 60  # give up on a witness search after settling this many nodes, adds a shortcut instead
+
+
+class ContractionHierarchy(object):
+    """
+    Contraction hierarchy over a directed graph in CSR form (nodes are 0..n-1).
+    Nodes are contracted one by one, least important first, adding shortcut
+    edges wherever a shortest path ran over the contracted node. A query then
+    only has to search upwards in the order from both ends, which settles
+    only a small part of the graph.
+    """
+    def __init__(self, offsets: List[int], indices: List[int], weights: List[int]):
+        self.size = len(offsets) - 1
+
+        # remaining graph during contraction, parallel edges keep the cheapest
+        out_edges: List[Dict[int, int]] = [{} for _ in range(self.size)]
+        in_edges: List[Dict[int, int]] = [{} for _ in range(self.size)]
+        for source in range(self.size):
+            for k in range(offsets[source], offsets[source + 1]):
+                target = indices[k]
+                if target == source:
+                    continue
+                if weights[k] < out_edges[source].get(target, math.inf):
+                    out_edges[source][target] = weights[k]
+                    in_edges[target][source] = weights[k]
+
+        # node a shortcut (source, target) skips over
+        self.middle: Dict[tuple[int, int], int] = {}
+        self.rank: List[int] = [0] * self.size
+        # upward edges, to nodes of higher rank, and downward edges reversed,
+        # so both searches of a query only follow edges up to higher ranks
+        self.up: List[Dict[int, int]] = [{} for _ in range(self.size)]
+        self.down: List[Dict[int, int]] = [{} for _ in range(self.size)]
+
+        contracted_neighbors = [0] * self.size
+        queue = [(self._priority(v, out_edges, in_edges, contracted_neighbors), v) for v in range(self.size)]
+        heapify(queue)
+        rank = 0
+        while queue:
+            _, v = heappop(queue)
+            # lazy update: the priority may have changed since it was pushed
+            shortcuts = self._shortcuts(v, out_edges, in_edges)
+            priority = len(shortcuts) - len(out_edges[v]) - len(in_edges[v]) + contracted_neighbors[v]
+            if queue and priority > queue[0][0]:
+                heappush(queue, (priority, v))
+                continue
+
+            self.rank[v] = rank
+            rank += 1
+            for (u, w), cost in shortcuts:
+                if self._add_edge(u, w, cost, out_edges, in_edges):
+                    self.middle[(u, w)] = v
+
+            for w, cost in out_edges[v].items():
+                self.up[v][w] = cost
+                del in_edges[w][v]
+                contracted_neighbors[w] += 1
+            for u, cost in in_edges[v].items():
+                self.down[v][u] = cost
+                del out_edges[u][v]
+                contracted_neighbors[u] += 1
+            out_edges[v] = {}
+            in_edges[v] = {}
+
+    def _add_edge(self, source: int, target: int, cost: int, out_edges, in_edges) -> bool:
+        """
+        Add the edge unless there already is one at most as expensive.
+        """
+        if cost < out_edges[source].get(target, math.inf):
+            out_edges[source][target] = cost
+            in_edges[target][source] = cost
+            return True
+        return False
+
+    def _shortcuts(self, v: int, out_edges, in_edges) -> List[tuple[tuple[int, int], int]]:
+        """
+        Shortcuts needed to keep all distances when v is removed.
+        """
+        shortcuts = []
+        if not out_edges[v]:
+            return shortcuts
+        max_out = max(out_edges[v].values())
+        for u, in_cost in in_edges[v].items():
+            witness = self._witness_search(u, v, in_cost + max_out, out_edges, out_edges[v])
+            for w, out_cost in out_edges[v].items():
+                if w == u:
+                    continue
+                if witness.get(w, math.inf) > in_cost + out_cost:
+                    shortcuts.append(((u, w), in_cost + out_cost))
+        return shortcuts
+
+    def _witness_search(self, source: int, avoid: int, max_distance: float, out_edges, targets: Dict[int, int]) -> Dict[int, float]:
+        """
+        Bounded dijkstra in the remaining graph that does not pass through avoid,
+        stops once all targets are settled.
+        """
+        distance = {source: 0}
+        frontier = [(0, source)]
+        settled = 0
+        remaining = len(targets)
+        while frontier and settled < WITNESS_SETTLE_LIMIT and remaining > 0:
+            current_distance, current = heappop(frontier)
+            if current_distance > distance[current]:
+                continue
+            if current_distance > max_distance:
+                break
+            settled += 1
+            if current in targets:
+                remaining -= 1
+            for neighbor, cost in out_edges[current].items():
+                if neighbor == avoid:
+                    continue
+                new_distance = current_distance + cost
+                if new_distance < distance.get(neighbor, math.inf):
+                    distance[neighbor] = new_distance
+                    heappush(frontier, (new_distance, neighbor))
+        return distance
+
+    def _priority(self, v: int, out_edges, in_edges, contracted_neighbors) -> int:
+        """
+        Edge difference plus contracted neighbors, keeps the hierarchy flat and the contraction spread out.
+        """
+        return len(self._shortcuts(v, out_edges, in_edges)) - len(out_edges[v]) - len(in_edges[v]) + contracted_neighbors[v]
+
+    def query(self, source: int, target: int) -> tuple[float, List[int]]:
+        """
+        Shortest distance and path from source to target, (math.inf, []) if there is none.
+        """
+        if source == target:
+            return 0, [source]
+
+        distances = ({source: 0}, {target: 0})
+        parents = ({source: -1}, {target: -1})
+        frontiers = ([(0, source)], [(0, target)])
+        edges = (self.up, self.down)
+        best = math.inf
+        meeting = -1
+        while frontiers[0] or frontiers[1]:
+            for side in (0, 1):
+                frontier = frontiers[side]
+                if not frontier:
+                    continue
+                if frontier[0][0] >= best:
+                    frontier.clear()  # nothing on this side can improve anymore
+                    continue
+                current_distance, current = heappop(frontier)
+                distance = distances[side]
+                if current_distance > distance[current]:
+                    continue
+                other = distances[1 - side].get(current)
+                if other is not None and current_distance + other < best:
+                    best = current_distance + other
+                    meeting = current
+                for neighbor, cost in edges[side][current].items():
+                    new_distance = current_distance + cost
+                    if new_distance < distance.get(neighbor, math.inf):
+                        distance[neighbor] = new_distance
+                        parents[side][neighbor] = current
+                        heappush(frontier, (new_distance, neighbor))
+
+        if meeting == -1:
+            return math.inf, []
+
+        forward = []
+        node = meeting
+        while node != -1:
+            forward.append(node)
+            node = parents[0][node]
+        forward.reverse()
+        backward = []
+        node = parents[1][meeting]
+        while node != -1:
+            backward.append(node)
+            node = parents[1][node]
+
+        # replace the shortcuts by the edges they stand for
+        nodes = forward + backward
+        path = [nodes[0]]
+        for source, target in zip(nodes[:-1], nodes[1:]):
+            path.extend(self._unpack(source, target))
+        return best, path
+
+    def _unpack(self, source: int, target: int) -> List[int]:
+        """
+        Nodes of the edge source -> target after source, shortcuts expanded.
+        """
+        result = []
+        stack = [(source, target)]
+        while stack:
+            a, b = stack.pop()
+            if (a, b) in self.middle:
+                v = self.middle[(a, b)]
+                stack.append((v, b))
+                stack.append((a, v))
+            else:
+                result.append(b)
+        return result
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+import math
+from typing import Callable, List
+
+
+NUM_LANDMARKS = 8
+
+
+class Landmarks(object):
+    """
+    Distances from and to a few landmark nodes, giving A* lower bounds by the
+    triangle inequality (ALT): d(v, t) >= d(L, t) - d(L, v) and d(v, t) >= d(v, L) - d(t, L).
+    The bounds also hold for searches restricted to a part of the graph,
+    as restricting can only make distances longer.
+    """
+    def __init__(self, nodes: List[int], from_landmark: List[List[float]], to_landmark: List[List[float]]):
+        self.nodes = nodes
+        self.from_landmark = from_landmark
+        self.to_landmark = to_landmark
+
+    def towards(self, target: int) -> List[tuple[List[float], List[float], float, float]]:
+        """
+        Everything needed for the bounds towards target, for each landmark that reaches target
+        and is reached from it. With one-way edges (the city graph) a search can still reach
+        nodes that can't get to such a landmark, their bound b[node] - bt is math.inf.
+        That proves the node can't reach target, the searches skip it.
+        """
+        return [
+            (f, b, f[target], b[target])
+            for f, b in zip(self.from_landmark, self.to_landmark)
+            if f[target] != math.inf and b[target] != math.inf
+        ]
+
+    def away_from(self, source: int) -> List[tuple[List[float], List[float], float, float]]:
+        """
+        Same as towards(), for lower bounds on the distance from source to a node:
+        d(s, v) >= d(L, v) - d(L, s) and d(s, v) >= d(s, L) - d(v, L).
+        """
+        return self.towards(source)
+
+    def heuristic(self, node: int, target: int) -> float:
+        """
+        Lower bound on the distance from node to target, 0 if no landmark helps,
+        math.inf if node can't reach target. The searches inline this with the result of towards().
+        """
+        h = 0
+        for f, b, ft, bt in self.towards(target):
+            h = max(h, ft - f[node], b[node] - bt)
+        return h
+
+
+def select_landmarks(candidates: List[int], forward: Callable[[int], List[float]], backward: Callable[[int], List[float]], count: int = NUM_LANDMARKS) -> Landmarks:
+    """
+    Pick landmarks by farthest point selection: each new landmark is the candidate
+    farthest away from all previous ones. Unreachable candidates count as farthest,
+    so every component gets a landmark before any gets a second one.
+    forward and backward return the distances from and to a node.
+    """
+    nodes = []
+    from_landmark = []
+    to_landmark = []
+    if not candidates:
+        return Landmarks(nodes, from_landmark, to_landmark)
+
+    distances = forward(candidates[0])
+    min_distance = {c: distances[c] for c in candidates}
+    for _ in range(min(count, len(candidates))):
+        node = max(candidates, key=lambda c: min_distance[c])
+        if min_distance[node] == 0:
+            break  # all candidates are landmarks already
+        distances = forward(node)
+        nodes.append(node)
+        from_landmark.append(distances)
+        to_landmark.append(backward(node))
+        for c in candidates:
+            if distances[c] < min_distance[c]:
+                min_distance[c] = distances[c]
+    return Landmarks(nodes, from_landmark, to_landmark)
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+
+from collections import OrderedDict
+from typing import Generic, Hashable, TypeVar
+
+
+T = TypeVar("T")
+
+
+class LRUCache(Generic[T]):
+    """
+    Dictionary holding at most maxsize entries, the least recently used one is dropped first.
+    Counts hits and misses, to see whether the size fits the workload.
+    """
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.entries: OrderedDict[Hashable, T] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> T|None:
+        """
+        The value stored for key, None if there is none.
+        """
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, key: Hashable, value: T):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        """
+        Drop all entries, the counters are kept.
+        """
+        self.entries.clear()
+
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.entries
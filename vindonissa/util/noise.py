@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+
+from ctypes import c_int64
+from typing import List
+
+import numpy as np
+
+
+STRETCH_CONSTANT2 = -0.211324865405187  # (1/Math.sqrt(2+1)-1)/2
+SQUISH_CONSTANT2 = 0.366025403784439  # (Math.sqrt(2+1)-1)/2
+NORM_CONSTANT2 = 47
+
+GRADIENTS2 = np.array([
+    5, 2, 2, 5,
+    -5, 2, -2, 5,
+    5, -2, 2, -5,
+    -5, -2, -2, -5,
+], dtype=np.int64)
+
+
+def _overflow(x: int) -> int:
+    return c_int64(x).value
+
+
+def create_permutation(seed: int) -> np.ndarray:
+    """
+    Build the permutation table exactly like OpenSimplex does,
+    so a NoiseField with the same seeds reproduces the same maps.
+    """
+    perm = np.zeros(256, dtype=np.int64)
+    source = list(range(256))
+    seed = _overflow(seed * 6364136223846793005 + 1442695040888963407)
+    seed = _overflow(seed * 6364136223846793005 + 1442695040888963407)
+    seed = _overflow(seed * 6364136223846793005 + 1442695040888963407)
+    for i in range(255, -1, -1):
+        seed = _overflow(seed * 6364136223846793005 + 1442695040888963407)
+        r = int((seed + 31) % (i + 1))
+        if r < 0:
+            r += i + 1
+        perm[i] = source[r]
+        source[r] = source[i]
+    return perm
+
+
+class NoiseField(object):
+    """
+    Vectorized 2D OpenSimplex noise for several octaves at once.
+    Each octave has its own seed; sampling takes coordinate arrays
+    of shape (octaves, points) and returns an array of the same shape
+    holding the same values OpenSimplex.noise2d would give per point.
+    """
+    def __init__(self, seeds: List[int]):
+        self.seeds = seeds
+        self.perm: np.ndarray = np.stack([create_permutation(s) for s in seeds])
+        # row offsets into the flattened permutation tables
+        self._offsets = (np.arange(len(seeds), dtype=np.int64) * 256)[:, None]
+
+    def _extrapolate(self, xsb: np.ndarray, ysb: np.ndarray, dx: np.ndarray, dy: np.ndarray) -> np.ndarray:
+        perm = self.perm.ravel()
+        index = perm[self._offsets + ((perm[self._offsets + (xsb & 0xFF)] + ysb) & 0xFF)] & 0x0E
+        return GRADIENTS2[index] * dx + GRADIENTS2[index + 1] * dy
+
+    def _contribution(self, xsb: np.ndarray, ysb: np.ndarray, dx: np.ndarray, dy: np.ndarray) -> np.ndarray:
+        attn = 2 - dx * dx - dy * dy
+        attn2 = attn * attn
+        return np.where(attn > 0, attn2 * attn2 * self._extrapolate(xsb, ysb, dx, dy), 0)
+
+    def sample(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        """
+        Evaluate every octave for every point in one go.
+        x and y must broadcast to shape (octaves, points).
+        """
+        shape = (len(self.seeds), np.broadcast(x, y).shape[-1])
+        x = np.broadcast_to(np.asarray(x, dtype=np.float64), shape)
+        y = np.broadcast_to(np.asarray(y, dtype=np.float64), shape)
+
+        # place input coordinates onto grid
+        stretch_offset = (x + y) * STRETCH_CONSTANT2
+        xs = x + stretch_offset
+        ys = y + stretch_offset
+
+        # floor to get grid coordinates of rhombus super-cell origin
+        xsb = np.floor(xs).astype(np.int64)
+        ysb = np.floor(ys).astype(np.int64)
+
+        squish_offset = (xsb + ysb) * SQUISH_CONSTANT2
+        xb = xsb + squish_offset
+        yb = ysb + squish_offset
+
+        xins = xs - xsb
+        yins = ys - ysb
+        in_sum = xins + yins
+
+        dx0 = x - xb
+        dy0 = y - yb
+
+        value = np.zeros(shape, dtype=np.float64)
+
+        # contribution (1,0)
+        value += self._contribution(xsb + 1, ysb + 0, dx0 - 1 - SQUISH_CONSTANT2, dy0 - 0 - SQUISH_CONSTANT2)
+        # contribution (0,1)
+        value += self._contribution(xsb + 0, ysb + 1, dx0 - 0 - SQUISH_CONSTANT2, dy0 - 1 - SQUISH_CONSTANT2)
+
+        lower = in_sum <= 1  # inside the triangle at (0,0), else at (1,1)
+        x_greater = xins > yins
+
+        # (0,0) or (1,1) is one of the closest two triangular vertices
+        zins_lower = 1 - in_sum
+        zins_upper = 2 - in_sum
+        near_lower = (zins_lower > xins) | (zins_lower > yins)
+        near_upper = (zins_upper < xins) | (zins_upper < yins)
+
+        xsv_ext = np.select(
+            [lower & near_lower & x_greater, lower & near_lower, lower, near_upper & x_greater, near_upper],
+            [xsb + 1, xsb - 1, xsb + 1, xsb + 2, xsb + 0],
+            xsb)
+        ysv_ext = np.select(
+            [lower & near_lower & x_greater, lower & near_lower, lower, near_upper & x_greater, near_upper],
+            [ysb - 1, ysb + 1, ysb + 1, ysb + 0, ysb + 2],
+            ysb)
+        dx_ext = np.select(
+            [lower & near_lower & x_greater, lower & near_lower, lower, near_upper & x_greater, near_upper],
+            [dx0 - 1, dx0 + 1, dx0 - 1 - 2 * SQUISH_CONSTANT2, dx0 - 2 - 2 * SQUISH_CONSTANT2, dx0 + 0 - 2 * SQUISH_CONSTANT2],
+            dx0)
+        dy_ext = np.select(
+            [lower & near_lower & x_greater, lower & near_lower, lower, near_upper & x_greater, near_upper],
+            [dy0 + 1, dy0 - 1, dy0 - 1 - 2 * SQUISH_CONSTANT2, dy0 + 0 - 2 * SQUISH_CONSTANT2, dy0 - 2 - 2 * SQUISH_CONSTANT2],
+            dy0)
+
+        # in the upper triangle the base vertex moves to (1,1)
+        xsb = np.where(lower, xsb, xsb + 1)
+        ysb = np.where(lower, ysb, ysb + 1)
+        dx0 = np.where(lower, dx0, dx0 - 1 - 2 * SQUISH_CONSTANT2)
+        dy0 = np.where(lower, dy0, dy0 - 1 - 2 * SQUISH_CONSTANT2)
+
+        # contribution (0,0) or (1,1)
+        value += self._contribution(xsb, ysb, dx0, dy0)
+        # extra vertex
+        value += self._contribution(xsv_ext, ysv_ext, dx_ext, dy_ext)
+
+        return value / NORM_CONSTANT2
+
+    def octaves(self, nx: np.ndarray, ny: np.ndarray, frequencies: List[float], wavelength: float) -> np.ndarray:
+        """
+        Sample each octave at its own frequency. Returns shape (octaves, points).
+        """
+        freqs = np.asarray(frequencies, dtype=np.float64)[:, None]
+        return self.sample(freqs * nx / wavelength, freqs * ny / wavelength)
@@ -1,113 +1,126 @@
 #!/usr/bin/env python3
 
-from typing import List
-from vindonissa.game_objects.cell import Cell
-from vindonissa.game_objects.city import WayNode
+from heapq import heappush, heappop
+from typing import Any, List
 
 
-class CityPriorityQueue (object):
-        
+# Lazy-deletion priority queues for the pathfinding.
+# All of them share the same interface: push(priority, item) and
+# pop() -> (priority, item) for the entry with the lowest priority.
+# Instead of changing the priority of an item, it is simply pushed again,
+# the search skips outdated entries when they come up.
+# Priorities have to be integers for the bucket and radix queues.
+
+
+class HeapQueue(object):
+    """
+    Binary heap, works for any priorities.
+    Items with the same priority come out in insertion order.
+    """
+    def __init__(self):
+        self.heap: List[tuple[int, int, Any]] = []
+        self.counter = 0
+
+    def __len__(self):
+        return len(self.heap)
+
+    def push(self, priority: int, item: Any) -> None:
+        self.counter += 1
+        heappush(self.heap, (priority, self.counter, item))
+
+    def pop(self) -> tuple[int, Any]:
+        priority, _, item = heappop(self.heap)
+        return priority, item
+
+    def clear(self):
+        self.heap.clear()
+        self.counter = 0
+
+
+class BucketQueue(object):
+    """
+    One bucket per priority value, the minimum only moves up between pushes
+    of lower priorities. Fast for small integer priorities, but the bucket
+    list grows up to the largest priority pushed.
+    Items with the same priority come out last in, first out.
+    """
     def __init__(self):
-        self.list: List[WayNode|None] = []
+        self.list: List[List[Any]] = []
         self.count = 0
-        self.minimum = -1  # -1 indicates no minimum yet
+        self.minimum = 0
 
-    def enqueue(self, cell: WayNode) -> None:
+    def __len__(self):
+        return self.count
+
+    def push(self, priority: int, item: Any) -> None:
         self.count += 1
-        priority = cell.search_priority
-        if self.minimum < 0 or priority < self.minimum:
+        if self.count == 1 or priority < self.minimum:
             self.minimum = priority
         while priority >= len(self.list):
-            self.list.append(None)
-        cell.next_cell_with_same_prio = self.list[priority]
-        self.list[priority] = cell
+            self.list.append([])
+        self.list[priority].append(item)
 
-    def dequeue(self) -> WayNode|None:
-        self.count -= 1
-        while self.minimum < len(self.list):
-            cell = self.list[self.minimum]
-            if cell is not None:
-                self.list[self.minimum] = cell.next_cell_with_same_prio
-                return cell
+    def pop(self) -> tuple[int, Any]:
+        while not self.list[self.minimum]:
             self.minimum += 1
-        return None
-    
-    def change(self, cell: WayNode, old_prio: int):
-        current = self.list[old_prio]
-        if current is not None:
-            next_cell = current.next_cell_with_same_prio
-        else:
-            next_cell = None
-        #print("next", next_cell)
-        if current == cell:
-            self.list[old_prio] = next_cell
-        else:
-            while next_cell != cell:
-                current = next_cell
-                if current is None:
-                    break
-                assert current is not None
-                next_cell = current.next_cell_with_same_prio
-            else:
-                current.next_cell_with_same_prio = cell.next_cell_with_same_prio
-        self.enqueue(cell)
         self.count -= 1
+        return self.minimum, self.list[self.minimum].pop()
 
     def clear(self):
-        self.list.clear()
+        for bucket in self.list:
+            bucket.clear()
         self.count = 0
-        self.minimum = -1
+        self.minimum = 0
 
 
-class CellPriorityQueue (object):
-        
+class RadixHeapQueue(object):
+    """
+    Radix heap for integer priorities. Buckets are sized by the highest
+    differing bit to the last popped priority, so only O(log C) buckets are
+    needed no matter how large the priorities get.
+    It is a monotone queue: pushing a priority below the last popped one
+    (inconsistent heuristics) is allowed, but such entries are treated as if
+    they had the last popped priority.
+    """
     def __init__(self):
-        self.list: List[Cell|None] = []
+        self.buckets: List[List[tuple[int, int, Any]]] = [[] for _ in range(65)]
         self.count = 0
-        self.minimum = -1  # -1 indicates no minimum yet
+        self.last = 0
+
+    def __len__(self):
+        return self.count
 
-    def enqueue(self, cell: Cell) -> None:
+    def push(self, priority: int, item: Any) -> None:
         self.count += 1
-        priority = cell.search_priority
-        if self.minimum < 0 or priority < self.minimum:
-            self.minimum = priority
-        while priority >= len(self.list):
-            self.list.append(None)
-        cell.next_cell_with_same_prio = self.list[priority]
-        self.list[priority] = cell
+        key = priority if priority > self.last else self.last
+        self.buckets[(key ^ self.last).bit_length()].append((key, priority, item))
 
-    def dequeue(self) -> Cell|None:
-        self.count -= 1
-        while self.minimum < len(self.list):
-            cell = self.list[self.minimum]
-            if cell is not None:
-                self.list[self.minimum] = cell.next_cell_with_same_prio
-                return cell
-            self.minimum += 1
-        return None
-    
-    def change(self, cell: Cell, old_prio: int):
-        current = self.list[old_prio]
-        if current is not None:
-            next_cell = current.next_cell_with_same_prio
-        else:
-            next_cell = None
-        #print("next", next_cell)
-        if current == cell:
-            self.list[old_prio] = next_cell
-        else:
-            while next_cell != cell:
-                current = next_cell
-                if current is None:
-                    break
-                assert current is not None
-                next_cell = current.next_cell_with_same_prio
-            else:
-                current.next_cell_with_same_prio = cell.next_cell_with_same_prio
-        self.enqueue(cell)
+    def pop(self) -> tuple[int, Any]:
+        buckets = self.buckets
+        if not buckets[0]:
+            # find the first non empty bucket and spread it over the lower ones
+            i = 1
+            while not buckets[i]:
+                i += 1
+            entries = buckets[i]
+            buckets[i] = []
+            last = min([entry[0] for entry in entries])
+            for entry in entries:
+                buckets[(entry[0] ^ last).bit_length()].append(entry)
+            self.last = last
         self.count -= 1
+        _, priority, item = buckets[0].pop()
+        return priority, item
 
     def clear(self):
-        self.list.clear()
+        for bucket in self.buckets:
+            bucket.clear()
         self.count = 0
-        self.minimum = -1
\ No newline at end of file
+        self.last = 0
+
+
+QUEUE_TYPES = {
+    "bucket": BucketQueue,
+    "heap": HeapQueue,
+    "radix": RadixHeapQueue,
+}
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+
+"""
+Compare the priority queue types of the pathfinding on a seeded map.
+
+Run from the repository root:
+python -m vindonissa.util.queue_benchmark
+"""
+
+import random
+import time
+
+from vindonissa.game_setup import mapgen, citygen
+from vindonissa.static_data.movement_costs import traderoute_cost
+from vindonissa.util.priority_queues import QUEUE_TYPES
+
+SEED = 42
+QUERIES = 300
+
+
+def benchmark(map, queue: str, cell_pairs, city_pairs):
+    start_time = time.process_time()
+    for source, target in cell_pairs:
+        map.cell_to_cell_path(source, target, traderoute_cost, queue=queue, cached=False)
+    cell_time = time.process_time() - start_time
+
+    start_time = time.process_time()
+    for source, target in city_pairs:
+        map.city_to_city_path(source, target, queue=queue, cached=False)
+    city_time = time.process_time() - start_time
+
+    return cell_time, city_time
+
+
+if __name__ == "__main__":
+    random.seed(SEED)
+    map = citygen.generate(mapgen.create_worldmap())
+
+    cell_pairs = [random.sample(map.cells, 2) for _ in range(QUERIES)]
+    city_pairs = [random.sample(map.cities, 2) for _ in range(QUERIES)]
+
+    print(f"{len(map.cells)} cells, {len(map.cities)} cities, {QUERIES} queries each")
+    for queue in QUEUE_TYPES:
+        cell_time, city_time = benchmark(map, queue, cell_pairs, city_pairs)
+        print(f"{queue:>6}: cell paths {cell_time:.2f}s, city paths {city_time:.2f}s")
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+
+from heapq import heappush, heappop
+from itertools import islice
+import math
+from typing import Dict, Generic, Iterator, List, Tuple, TypeVar
+
+
+T = TypeVar("T")
+
+ITEMS_PER_BUCKET = 2  # average number of items per grid bucket
+
+
+class SpatialIndex(Generic[T]):
+    """
+    Uniform grid over item positions for nearest neighbor and radius queries.
+    Items at the same distance come in the order they were given,
+    so nearest() yields the same order as a stable sort by math.dist.
+    """
+    def __init__(self, items: List[T], positions: List[Tuple[float, float]]):
+        self.items = items
+        self.positions = positions
+
+        if positions:
+            self.min_x = min([x for x, y in positions])
+            self.min_y = min([y for x, y in positions])
+            max_x = max([x for x, y in positions])
+            max_y = max([y for x, y in positions])
+        else:
+            self.min_x = self.min_y = max_x = max_y = 0
+        area = max(max_x - self.min_x, 1) * max(max_y - self.min_y, 1)
+        self.bucket_size: float = math.sqrt(area * ITEMS_PER_BUCKET / max(len(items), 1))
+        self.columns = int((max_x - self.min_x) / self.bucket_size) + 1
+        self.rows = int((max_y - self.min_y) / self.bucket_size) + 1
+
+        self.buckets: Dict[Tuple[int, int], List[int]] = {}
+        for i, (x, y) in enumerate(positions):
+            self.buckets.setdefault(self._bucket(x, y), []).append(i)
+
+    def _bucket(self, x: float, y: float) -> Tuple[int, int]:
+        return int((x - self.min_x) // self.bucket_size), int((y - self.min_y) // self.bucket_size)
+
+    def _ring(self, column: int, row: int, r: int) -> Iterator[int]:
+        """
+        Item indices of all buckets with chebyshev distance r to the given one.
+        """
+        if r == 0:
+            yield from self.buckets.get((column, row), [])
+            return
+        for c in range(column - r, column + r + 1):
+            yield from self.buckets.get((c, row - r), [])
+            yield from self.buckets.get((c, row + r), [])
+        for w in range(row - r + 1, row + r):
+            yield from self.buckets.get((column - r, w), [])
+            yield from self.buckets.get((column + r, w), [])
+
+    def nearest(self, x: float, y: float) -> Iterator[T]:
+        """
+        Yield all items ordered by their distance to (x, y), closest first.
+        Only looks at as much of the grid as the caller consumes.
+        """
+        for _, i in self._nearest(x, y):
+            yield self.items[i]
+
+    def _nearest(self, x: float, y: float) -> Iterator[Tuple[float, int]]:
+        column, row = self._bucket(x, y)
+        # rings beyond this one hold no buckets anymore
+        max_ring = max(column, self.columns - 1 - column, row, self.rows - 1 - row, 0)
+        frontier = []
+        for r in range(max_ring + 1):
+            for i in self._ring(column, row, r):
+                heappush(frontier, (math.dist((x, y), self.positions[i]), i))
+            # items in the next ring are at least this far away
+            bound = self._ring_bound(x, y, column, row, r) if r < max_ring else math.inf
+            while frontier and frontier[0][0] < bound:
+                yield heappop(frontier)
+
+    def _ring_bound(self, x: float, y: float, column: int, row: int, r: int) -> float:
+        """
+        Smallest possible distance from (x, y) to an item in ring r + 1.
+        """
+        left = x - (self.min_x + (column - r) * self.bucket_size)
+        right = self.min_x + (column + r + 1) * self.bucket_size - x
+        top = y - (self.min_y + (row - r) * self.bucket_size)
+        bottom = self.min_y + (row + r + 1) * self.bucket_size - y
+        return min(left, right, top, bottom) - 1e-9  # rather wait a ring longer than misorder on rounding
+
+    def k_nearest(self, x: float, y: float, k: int) -> List[T]:
+        return list(islice(self.nearest(x, y), k))
+
+    def within_radius(self, x: float, y: float, radius: float) -> List[T]:
+        """
+        All items with a distance of at most radius to (x, y), closest first.
+        """
+        result = []
+        for distance, i in self._nearest(x, y):
+            if distance > radius:
+                break
+            result.append(self.items[i])
+        return result
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+
+from typing import List
+
+import numpy as np
+
+
+class UnionFind(object):
+    """
+    Disjoint sets over the integers 0..size-1,
+    with union by size and path halving.
+    """
+    def __init__(self, size: int):
+        self.parent: List[int] = list(range(size))
+        self.size: List[int] = [1] * size
+
+    def find(self, a: int) -> int:
+        parent = self.parent
+        while parent[a] != a:
+            parent[a] = parent[parent[a]]
+            a = parent[a]
+        return a
+
+    def union(self, a: int, b: int):
+        a = self.find(a)
+        b = self.find(b)
+        if a == b:
+            return
+        if self.size[a] < self.size[b]:
+            a, b = b, a
+        self.parent[b] = a
+        self.size[a] += self.size[b]
+
+    def labels(self, members: List[bool]) -> List[int]:
+        """
+        Number the sets in order of their lowest member, elements that are no members get -1.
+        """
+        labels = [-1] * len(self.parent)
+        root_label = {}
+        for a in range(len(self.parent)):
+            if not members[a]:
+                continue
+            root = self.find(a)
+            if root not in root_label:
+                root_label[root] = len(root_label)
+            labels[a] = root_label[root]
+        return labels
+
+
+def label_components(offsets: np.ndarray, indices: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    """
+    Label the connected components of the nodes with mask set in a CSR graph,
+    only following edges between such nodes.
+    Components are numbered in order of their lowest node, nodes outside the mask get -1.
+    """
+    sources = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    keep = (sources < indices) & mask[sources] & mask[indices]
+    sets = UnionFind(len(offsets) - 1)
+    for a, b in zip(sources[keep].tolist(), indices[keep].tolist()):
+        sets.union(a, b)
+    return np.array(sets.labels(mask.tolist()), dtype=np.int32)